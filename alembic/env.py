@@ -5,20 +5,25 @@ from sqlalchemy import pool
 
 from alembic import context
 
+from database.models import Base
+from utils.db import DATABASE_URL, IS_SQLITE
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-if config.config_file_name is not None:
+# Desde startup_database() no: fileConfig desactivaría los loggers "asadas" de la app
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
     fileConfig(config.config_file_name)
 
+# La misma base que usa la app (DATABASE_URL), no la URL de ejemplo de alembic.ini
+config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
+
 # add your model's MetaData object here
 # for 'autogenerate' support
-# from myapp import mymodel
-# target_metadata = mymodel.Base.metadata
-target_metadata = None
+target_metadata = Base.metadata
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -44,6 +49,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        render_as_batch=IS_SQLITE,
     )
 
     with context.begin_transaction():
@@ -57,6 +63,12 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
+    # startup_database() pasa su propia conexión; desde la CLI se crea un engine aparte
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run_migrations(connection)
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
@@ -64,12 +76,19 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
+        _run_migrations(connection)
+
+
+def _run_migrations(connection) -> None:
+    # SQLite no tiene ALTER para constraints/defaults: batch recrea la tabla
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        render_as_batch=IS_SQLITE,
+    )
 
-        with context.begin_transaction():
-            context.run_migrations()
+    with context.begin_transaction():
+        context.run_migrations()
 
 
 if context.is_offline_mode():
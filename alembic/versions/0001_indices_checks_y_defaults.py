@@ -0,0 +1,138 @@
+"""indices compuestos, CHECK y server defaults en tank_readings y alerts
+
+Bases creadas antes de estos cambios del modelo: create_all() no altera tablas
+que ya existen, así que aquí se agregan los índices, constraints y defaults que
+faltan. Todo se revisa antes de tocarlo, para que también sirva en bases que
+ya tienen una parte.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-15 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Índices de una sola columna que reemplaza ix_tank_readings_tank_time
+OLD_INDEXES = {
+    "tank_readings": ("ix_tank_readings_timestamp", "ix_tank_readings_tank_id"),
+}
+
+# tabla -> [(nombre, columnas, WHERE del índice parcial)]
+NEW_INDEXES = {
+    "tank_readings": [
+        ("ix_tank_readings_tank_time", ["tank_id", sa.text("timestamp DESC")], None),
+    ],
+    "alerts": [
+        ("ix_alerts_tank_status_time", ["tank_id", "status", sa.text("timestamp DESC")], None),
+        ("ix_alerts_active", ["tank_id", sa.text("timestamp DESC")], "status = 'active'"),
+    ],
+}
+
+# tabla -> {nombre: condición}
+CHECKS = {
+    "tank_readings": {
+        "ck_tank_readings_tank_id": "tank_id IN ('tank_a', 'tank_b')",
+        "ck_tank_readings_chlorine_status":
+            "chlorine_status IS NULL OR chlorine_status IN ('low', 'normal', 'optimal', 'high')",
+        "ck_tank_readings_sensor_status": "sensor_status IN ('active', 'error', 'maintenance')",
+        "ck_tank_readings_data_source": "data_source IN ('sensor', 'manual', 'simulation')",
+    },
+    "alerts": {
+        "ck_alerts_tank_id": "tank_id IN ('tank_a', 'tank_b', 'system')",
+        "ck_alerts_severity": "severity IN ('low', 'medium', 'high', 'critical')",
+        "ck_alerts_status": "status IN ('active', 'resolved', 'acknowledged')",
+    },
+}
+
+# tabla -> {columna: (tipo, server_default)}
+SERVER_DEFAULTS = {
+    "tank_readings": {
+        "timestamp": (sa.DateTime(), sa.func.now()),
+        "pump_status": (sa.Boolean(), sa.false()),
+        "chlorinator_status": (sa.Boolean(), sa.false()),
+        "sensor_status": (sa.String(20), sa.text("'active'")),
+        "data_source": (sa.String(20), sa.text("'sensor'")),
+    },
+    "alerts": {
+        "timestamp": (sa.DateTime(), sa.func.now()),
+        "status": (sa.String(20), sa.text("'active'")),
+        "email_sent": (sa.Boolean(), sa.false()),
+    },
+}
+
+
+def _create_index(table: str, name: str, columns, where) -> None:
+    kwargs = {}
+    if where is not None:
+        kwargs = {"postgresql_where": sa.text(where), "sqlite_where": sa.text(where)}
+    op.create_index(name, table, columns, **kwargs)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+
+    for table in ("tank_readings", "alerts"):
+        if not inspector.has_table(table):
+            continue
+
+        indexes = {ix["name"] for ix in inspector.get_indexes(table)}
+        checks = {ck["name"] for ck in inspector.get_check_constraints(table)}
+        defaults = {col["name"]: col.get("default") for col in inspector.get_columns(table)}
+
+        # Fuera del batch: en SQLite el batch recrea la tabla y perdería el DESC y el WHERE
+        for name in OLD_INDEXES.get(table, ()) + tuple(ix[0] for ix in NEW_INDEXES[table]):
+            if name in indexes:
+                op.drop_index(name, table_name=table)
+
+        missing_checks = {name: sql for name, sql in CHECKS[table].items() if name not in checks}
+        missing_defaults = {
+            col: spec for col, spec in SERVER_DEFAULTS[table].items()
+            if col in defaults and defaults[col] is None
+        }
+        if missing_checks or missing_defaults:
+            with op.batch_alter_table(table) as batch_op:
+                for col, (type_, default) in missing_defaults.items():
+                    batch_op.alter_column(col, existing_type=type_, server_default=default)
+                for name, sql in missing_checks.items():
+                    batch_op.create_check_constraint(name, sql)
+
+        for name, columns, where in NEW_INDEXES[table]:
+            _create_index(table, name, columns, where)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+
+    for table in ("tank_readings", "alerts"):
+        if not inspector.has_table(table):
+            continue
+
+        indexes = {ix["name"] for ix in inspector.get_indexes(table)}
+        checks = {ck["name"] for ck in inspector.get_check_constraints(table)}
+
+        for name, _, _ in NEW_INDEXES[table]:
+            if name in indexes:
+                op.drop_index(name, table_name=table)
+
+        with op.batch_alter_table(table) as batch_op:
+            for col, (type_, _) in SERVER_DEFAULTS[table].items():
+                batch_op.alter_column(col, existing_type=type_, server_default=None)
+            for name in CHECKS[table]:
+                if name in checks:
+                    batch_op.drop_constraint(name, type_="check")
+
+    op.create_index("ix_tank_readings_timestamp", "tank_readings", ["timestamp"])
+    op.create_index("ix_tank_readings_tank_id", "tank_readings", ["tank_id"])
@@ -3,9 +3,9 @@ Modelos de Base de Datos para Sistema ASADAS Tsa Diglo
 Sistema de Monitoreo de Tanques A (Cisterna) y B (150m³)
 """
 
-from sqlalchemy import Column, Integer, Float, String, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, Float, String, DateTime, Boolean, Text, Index, CheckConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, false
 from datetime import datetime
 
 Base = declarative_base()
@@ -19,10 +19,10 @@ class TankReading(Base):
     __tablename__ = "tank_readings"
 
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=func.now(), index=True)
+    timestamp = Column(DateTime, server_default=func.now())
 
     # Identificación del tanque
-    tank_id = Column(String(10), index=True)  # 'tank_a' o 'tank_b'
+    tank_id = Column(String(10))  # 'tank_a' o 'tank_b'
     tank_name = Column(String(50))  # 'Cisterna' o 'Tanque 150'
 
     # Mediciones de nivel de agua
@@ -32,15 +32,33 @@ class TankReading(Base):
 
     # Mediciones de cloro (solo Tanque B)
     chlorine_ppm = Column(Float, nullable=True)  # Partes por millón
-    chlorine_status = Column(String(20), nullable=True)  # 'normal', 'low', 'high'
+    chlorine_status = Column(String(20), nullable=True)  # 'low', 'normal', 'optimal', 'high'
 
     # Estado del sistema
-    pump_status = Column(Boolean, default=False)  # Bomba encendida/apagada
-    chlorinator_status = Column(Boolean, default=False)  # Clorador encendido/apagado
+    pump_status = Column(Boolean, server_default=false())  # Bomba encendida/apagada
+    chlorinator_status = Column(Boolean, server_default=false())  # Clorador encendido/apagado
 
     # Metadatos
-    sensor_status = Column(String(20), default='active')  # 'active', 'error', 'maintenance'
-    data_source = Column(String(20), default='sensor')  # 'sensor', 'manual', 'simulation'
+    sensor_status = Column(String(20), server_default='active')  # 'active', 'error', 'maintenance'
+    data_source = Column(String(20), server_default='sensor')  # 'sensor', 'manual', 'simulation'
+
+    # "Última lectura por tanque" / "lecturas de un tanque desde X": un solo range scan
+    __table_args__ = (
+        Index('ix_tank_readings_tank_time', tank_id, timestamp.desc()),
+        CheckConstraint("tank_id IN ('tank_a', 'tank_b')", name='ck_tank_readings_tank_id'),
+        CheckConstraint(
+            "chlorine_status IS NULL OR chlorine_status IN ('low', 'normal', 'optimal', 'high')",
+            name='ck_tank_readings_chlorine_status',
+        ),
+        CheckConstraint(
+            "sensor_status IN ('active', 'error', 'maintenance')",
+            name='ck_tank_readings_sensor_status',
+        ),
+        CheckConstraint(
+            "data_source IN ('sensor', 'manual', 'simulation')",
+            name='ck_tank_readings_data_source',
+        ),
+    )
 
 
 class Alert(Base):
@@ -50,7 +68,7 @@ class Alert(Base):
     __tablename__ = "alerts"
 
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=func.now(), index=True)
+    timestamp = Column(DateTime, server_default=func.now(), index=True)
 
     # Información de la alerta
     alert_type = Column(String(30))  # 'water_level', 'chlorine', 'pump', 'sensor'
@@ -62,7 +80,7 @@ class Alert(Base):
     message = Column(Text)
 
     # Estado de la alerta
-    status = Column(String(20), default='active')  # 'active', 'resolved', 'acknowledged'
+    status = Column(String(20), server_default='active')  # 'active', 'resolved', 'acknowledged'
     resolved_at = Column(DateTime, nullable=True)
 
     # Valores que activaron la alerta
@@ -70,9 +88,28 @@ class Alert(Base):
     threshold_value = Column(Float, nullable=True)
 
     # Notificaciones
-    email_sent = Column(Boolean, default=False)
+    email_sent = Column(Boolean, server_default=false())
     email_sent_at = Column(DateTime, nullable=True)
 
+    __table_args__ = (
+        Index('ix_alerts_tank_status_time', tank_id, status, timestamp.desc()),
+        # La UI casi siempre filtra alertas activas
+        Index(
+            'ix_alerts_active', tank_id, timestamp.desc(),
+            postgresql_where=(status == 'active'),
+            sqlite_where=(status == 'active'),
+        ),
+        CheckConstraint("tank_id IN ('tank_a', 'tank_b', 'system')", name='ck_alerts_tank_id'),
+        CheckConstraint(
+            "severity IN ('low', 'medium', 'high', 'critical')",
+            name='ck_alerts_severity',
+        ),
+        CheckConstraint(
+            "status IN ('active', 'resolved', 'acknowledged')",
+            name='ck_alerts_status',
+        ),
+    )
+
 
 class SystemConfiguration(Base):
     """
@@ -3,92 +3,509 @@ API FastAPI para Sistema ASADAS Tsa Diglo
 Endpoints para servir datos de sensores simulados con controles manuales
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, Any, List
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from typing import Dict, Any, List, Literal, Mapping, Optional
+from types import MappingProxyType
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 import asyncio
+import logging
+import logging.handlers
 import os
+import queue
+import sys
+import time
+import numpy as np
+import orjson
 import uvicorn
 from contextlib import asynccontextmanager
 
+from fastapi_cache import FastAPICache
+from fastapi_cache.coder import Coder
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.decorator import cache
+
 # ✅ Import explícito (evita conflicto por archivos duplicados)
 from simulation_api.data_generator import (
     sensor_generator,
     get_latest_readings,
     get_tank_reading,
-    TankType,
     TANK_CONFIGS,
 )
+from utils.db import startup_database, flush_readings, get_history_rollup
+
+# =================== LOGGING ===================
+# Los handlers escriben desde un hilo aparte (QueueListener): el event loop no bloquea en stdout
+
+logger = logging.getLogger("asadas")
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+logger.propagate = False
+
+_log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+
+CACHE_ERROR_RETRY_SECONDS = 5.0  # Espera del actualizador antes de reintentar tras un error
+# Segundos mínimos entre logs de error: bastante más que el reintento, o se loguearía cada error
+CACHE_ERROR_LOG_INTERVAL = 60.0
 
 # =================== VARIABLES GLOBALES ===================
 
 latest_readings_cache: List[Dict[str, Any]] = []
+latest_readings_by_id: Dict[str, Dict[str, Any]] = {}  # Índice tank_id -> lectura
 last_update: datetime = datetime.now()
 
-manual_controls = {
-    "pump_manual_mode": False,          # False = automático, True = manual
-    "pump_manual_state": False,         # Estado manual de la bomba
-    "chlorinator_manual_mode": False,   # False = automático, True = manual
-    "chlorinator_manual_state": False,  # Estado manual del clorador
-    "last_manual_action": {
-        "pump": None,
-        "chlorinator": None
-    }
-}
+# Señal de cambio de estado de equipos: despierta al actualizador, que no avanza la simulación por ella
+# (se crea de nuevo en cada lifespan: un asyncio.Event queda ligado al loop que lo espera primero)
+readings_event = asyncio.Event()
+READINGS_HEARTBEAT_SECONDS = 30  # Tick de simulación si no hay cambios
+
+# Suscriptores SSE de /api/events (una cola por conexión)
+event_subscribers: "set[asyncio.Queue[bytes]]" = set()
+EVENTS_KEEPALIVE_SECONDS = 15
+
+# Respuestas de estado precalculadas (sin timestamp), ver rebuild_status_payloads()
+latest_status_payload: Dict[str, Any] = {}
+latest_control_status_payload: Dict[str, Any] = {}
+# /api/readings por defecto (filas, sin proyección) ya serializado con orjson
+latest_readings_blob: bytes = b""
+
+# Lecturas pendientes de persistir; se insertan en lote cada READINGS_FLUSH_CYCLES ciclos
+pending_readings: List[Dict[str, Any]] = []
+READINGS_FLUSH_CYCLES = 10  # 10 × 30s = 5 min
+
+
+@dataclass(slots=True)
+class ManualControls:
+    """Estado de los controles manuales (False = automático, True = manual)"""
+    pump_manual_mode: bool = False
+    pump_manual_state: bool = False          # Estado manual de la bomba
+    chlorinator_manual_mode: bool = False
+    chlorinator_manual_state: bool = False   # Estado manual del clorador
+    last_pump_action: Optional[Dict[str, Any]] = None
+    last_chlorinator_action: Optional[Dict[str, Any]] = None
+
+    def last_actions(self) -> Dict[str, Any]:
+        return {"pump": self.last_pump_action, "chlorinator": self.last_chlorinator_action}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Forma JSON histórica de la API"""
+        return {
+            "pump_manual_mode": self.pump_manual_mode,
+            "pump_manual_state": self.pump_manual_state,
+            "chlorinator_manual_mode": self.chlorinator_manual_mode,
+            "chlorinator_manual_state": self.chlorinator_manual_state,
+            "last_manual_action": self.last_actions(),
+        }
+
+
+manual_controls = ManualControls()
+
+
+class ORJSONCoder(Coder):
+    """
+    Coder de fastapi-cache con orjson: los datetime quedan como el mismo string ISO
+    (naive, hora local) que envía ORJSONResponse, así un HIT responde igual que el MISS.
+    El JsonCoder por defecto los decodifica con pendulum como UTC ("...+00:00")
+    """
+
+    @classmethod
+    def encode(cls, value: Any) -> bytes:
+        return orjson.dumps(value, default=_orjson_default)
+
+    @classmethod
+    def decode(cls, value: bytes) -> Any:
+        return orjson.loads(value)
+
+
+def _orjson_default(value: Any) -> Any:
+    # MappingProxyType (respuestas estáticas de solo lectura) no es un dict para orjson
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
 
 # ✅ Tu frontend real (fallback si no configurás FRONTEND_ORIGINS en cloud)
 DEFAULT_FRONTEND_ORIGIN = "https://sandro-uva-proyecto-final-blue-sun.reflex.run"
 
 
+# =================== RESPUESTAS ESTÁTICAS ===================
+# Se construyen una sola vez: no cambian durante la vida del proceso
+
+ROOT_RESPONSE_STATIC: Dict[str, Any] = {
+    "message": "Asada Tsa Diglo Wak - Sistema de Monitoreo y Control de Tanques",
+    "version": "2.0.0",
+    "system": "Tanque A (Cisterna) + Tanque B (150m³)",
+    "features": [
+        "Monitoreo de nivel de agua en tiempo real",
+        "Control automático y manual de bombeo",
+        "Control automático y manual de cloración",
+        "Sistema de alertas inteligente",
+        "Datos históricos para análisis con IA",
+    ],
+    "control_endpoints": {
+        "pump_on": "POST /api/control/pump/on",
+        "pump_off": "POST /api/control/pump/off",
+        "chlorinator_on": "POST /api/control/chlorinator/on",
+        "chlorinator_off": "POST /api/control/chlorinator/off",
+        "auto_mode": "POST /api/control/auto",
+        "any_action": "POST /api/control (body: {\"action\": ...})",
+    },
+    "monitoring_endpoints": {
+        "current_readings": "GET /api/readings",
+        "system_status": "GET /api/status",
+        "control_status": "GET /api/control/status",
+        "dashboard": "GET /api/dashboard",
+        "events_stream": "GET /api/events",
+    },
+}
+
+# Solo lectura: se comparte entre todas las respuestas de /api/config
+TANK_CONFIG_RESPONSE: Mapping[str, Mapping[str, Any]] = MappingProxyType({
+    tank_id: MappingProxyType({
+        "tank_id": config.tank_id,
+        "name": config.name,
+        "capacity_m3": config.capacity_m3,
+        "max_height_cm": config.max_height_cm,
+        "min_height_cm": config.min_height_cm,
+        "has_chlorine_sensor": config.has_chlorine_sensor,
+        "normal_consumption_rate": config.normal_consumption_rate,
+    })
+    for tank_id, config in TANK_CONFIGS.items()
+})
+
+
 # =================== UTILIDADES ===================
 
-def iso(dt: Any) -> str:
-    """Convierte datetime a ISO string para respuesta JSON segura."""
-    if isinstance(dt, datetime):
-        return dt.isoformat()
-    return str(dt)
+# ?format=rows (lista de objetos, por defecto) o ?format=columnar (una lista por campo)
+FORMAT_QUERY = Query("rows", alias="format", pattern="^(rows|columnar)$")
+
+
+# ?fields=a,b,c: proyección de columnas (solo los campos que el cliente usa)
+FIELDS_QUERY = Query(None, max_length=512)
+
+
+def project_fields(rows: List[Dict[str, Any]], fields: Optional[str]) -> List[Dict[str, Any]]:
+    """Dejar en cada lectura solo los campos pedidos; sin ?fields se devuelven completas"""
+    if not fields:
+        return rows
+    keys = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    return [{key: row[key] for key in keys if key in row} for row in rows]
+
+
+def to_columnar(rows: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Convertir lista de dicts a columnas; los campos ausentes quedan en None"""
+    keys: Dict[str, None] = {}
+    for row in rows:
+        keys.update(dict.fromkeys(row))
+    return {key: [row.get(key) for row in rows] for key in keys}
+
+
+def simulated_history_columns(now: datetime, hours: int) -> Dict[str, List[Any]]:
+    """Histórico simulado (un punto cada 30 min) en columnas, más reciente primero"""
+    points = hours * 2
+
+    # Series calculadas en bloque con NumPy (sin bucle Python por punto)
+    i = np.arange(points)
+    base_level_a = 120 + 10 * (i % 10) / 10
+    base_level_b = 200 + 15 * (i % 8) / 8
+    base_chlorine = 1.2 + 0.3 * (i % 6) / 6
+
+    return {
+        "timestamp": [now - timedelta(minutes=30 * k) for k in range(points)],
+        "tank_a_level_cm": np.round(base_level_a, 2).tolist(),
+        "tank_a_level_percent": np.round(base_level_a / 180 * 100, 1).tolist(),
+        "tank_b_level_cm": np.round(base_level_b, 2).tolist(),
+        "tank_b_level_percent": np.round(base_level_b / 300 * 100, 1).tolist(),
+        "chlorine_ppm": np.round(base_chlorine, 3).tolist(),
+    }
+
+
+def snapshot_readings(now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Lecturas del estado actual de los equipos, sin avanzar la simulación"""
+    return sensor_generator.build_readings(now)
 
 
-def apply_manual_controls() -> None:
-    """Aplicar estados de control manual a los equipos (sobre el generador)"""
+def sync_controls_to_generator() -> None:
+    """Reflejar manual_controls en el generador; se llama solo cuando cambia un control"""
+    sensor_generator.pump_manual_override = manual_controls.pump_manual_mode
+    sensor_generator.chlorinator_manual_override = manual_controls.chlorinator_manual_mode
+
     # Control manual de bomba
-    if manual_controls["pump_manual_mode"]:
-        sensor_generator.tank_states[TankType.TANK_A]["pump_running"] = manual_controls["pump_manual_state"]
+    if manual_controls.pump_manual_mode:
+        sensor_generator.tank_states["tank_a"]["pump_running"] = manual_controls.pump_manual_state
 
     # Control manual de clorador
-    if manual_controls["chlorinator_manual_mode"]:
-        sensor_generator.tank_states[TankType.TANK_B]["chlorinator_running"] = manual_controls["chlorinator_manual_state"]
+    if manual_controls.chlorinator_manual_mode:
+        sensor_generator.tank_states["tank_b"]["chlorinator_running"] = manual_controls.chlorinator_manual_state
 
 
-async def update_readings_cache() -> None:
-    """Actualizar cache de lecturas cada 30 segundos considerando controles manuales"""
-    global latest_readings_cache, last_update
+async def wait_for_readings_event(timeout: float = READINGS_HEARTBEAT_SECONDS) -> bool:
+    """
+    Esperar un cambio de estado o, como máximo, timeout segundos
+    Devuelve True si despertó por un cambio de controles y False si venció el plazo
+    """
+    try:
+        await asyncio.wait_for(readings_event.wait(), timeout=max(0.0, timeout))
+        woken = True
+    except asyncio.TimeoutError:
+        woken = False
+    readings_event.clear()
+    return woken
+
+
+def install_readings(readings: List[Dict[str, Any]], now: datetime) -> None:
+    """Dejar las lecturas como las vigentes, con su índice por tank_id (un solo swap de referencias)"""
+    global latest_readings_cache, latest_readings_by_id, last_update
+
+    latest_readings_by_id = {r["tank_id"]: r for r in readings}
+    latest_readings_cache = readings
+    last_update = now
+    rebuild_status_payloads()
+
+
+def refresh_readings_cache() -> None:
+    """Avanzar la simulación un tick, guardar las lecturas para persistir y publicarlas"""
+    # Un solo reloj por refresco: lecturas, last_update y evento SSE comparten timestamp
+    now = datetime.now()
+    readings = get_latest_readings(now)
+    install_readings(readings, now)
+    pending_readings.extend(readings)
+    publish_readings(readings, now)
+
+
+def publish_readings(readings: List[Dict[str, Any]], now: datetime) -> None:
+    """Enviar lecturas a todos los suscriptores SSE; si un cliente va atrasado se descarta lo viejo"""
+    if not event_subscribers:
+        return
+
+    message = b"data: " + orjson.dumps({"timestamp": now, "readings": readings}) + b"\n\n"
+    for subscriber in event_subscribers:
+        if subscriber.full():
+            subscriber.get_nowait()
+        subscriber.put_nowait(message)
+
+
+def build_system_status_payload() -> Dict[str, Any]:
+    """Armar la respuesta de /api/status (sin timestamp) a partir del cache de lecturas"""
+    tank_a_data = latest_readings_by_id.get("tank_a")
+    tank_b_data = latest_readings_by_id.get("tank_b")
+
+    alerts = []
+
+    if tank_a_data:
+        level_percent = tank_a_data["water_level_percent"]
+        if level_percent < 20:
+            alerts.append({
+                "type": "low_water",
+                "tank": "tank_a",
+                "severity": "high",
+                "message": f"Nivel bajo en Cisterna: {level_percent:.1f}%",
+                "action_required": "Verificar captaciones de agua"
+            })
+        elif level_percent > 90:
+            alerts.append({
+                "type": "high_water",
+                "tank": "tank_a",
+                "severity": "medium",
+                "message": f"Cisterna casi llena: {level_percent:.1f}%",
+                "action_required": "Bomba debería activarse automáticamente"
+            })
 
+    if tank_b_data:
+        level_percent = tank_b_data["water_level_percent"]
+        if level_percent < 25:
+            alerts.append({
+                "type": "low_water",
+                "tank": "tank_b",
+                "severity": "critical",
+                "message": f"Nivel crítico en Tanque 150: {level_percent:.1f}%",
+                "action_required": "Activar bomba manualmente si es necesario"
+            })
+
+        chlorine = tank_b_data["chlorine_ppm"]
+        if chlorine < 0.5:
+            alerts.append({
+                "type": "low_chlorine",
+                "tank": "tank_b",
+                "severity": "high",
+                "message": f"Cloro bajo: {chlorine:.2f} ppm",
+                "action_required": "Activar clorador manualmente"
+            })
+        elif chlorine > 2.0:
+            alerts.append({
+                "type": "high_chlorine",
+                "tank": "tank_b",
+                "severity": "medium",
+                "message": f"Cloro alto: {chlorine:.2f} ppm",
+                "action_required": "Detener clorador temporalmente"
+            })
+
+    return {
+        "success": True,
+        "system_operational": True,
+        "tanks_online": len(latest_readings_cache),
+        "last_reading": last_update,
+        "alerts": alerts,
+        "alerts_count": len(alerts),
+        "control_status": manual_controls.to_dict(),
+        "tank_summary": {
+            # Cada builder del generador emite siempre las mismas claves: indexado directo
+            "tank_a": {
+                "name": "Cisterna",
+                "level_percent": tank_a_data["water_level_percent"],
+                "level_cm": tank_a_data["water_level_cm"],
+                "volume_m3": tank_a_data["water_volume_m3"],
+                "pump_running": tank_a_data["pump_status"],
+                "pump_mode": "manual" if manual_controls.pump_manual_mode else "automatic",
+            } if tank_a_data else None,
+            "tank_b": {
+                "name": "Tanque 150",
+                "level_percent": tank_b_data["water_level_percent"],
+                "level_cm": tank_b_data["water_level_cm"],
+                "volume_m3": tank_b_data["water_volume_m3"],
+                "chlorine_ppm": tank_b_data["chlorine_ppm"],
+                "chlorine_status": tank_b_data["chlorine_status"],
+                "chlorinator_running": tank_b_data["chlorinator_status"],
+                "chlorinator_mode": "manual" if manual_controls.chlorinator_manual_mode else "automatic",
+            } if tank_b_data else None,
+        },
+    }
+
+
+def build_control_status_payload() -> Dict[str, Any]:
+    """Armar la respuesta de /api/control/status (sin timestamp)"""
+    return {
+        "success": True,
+        "manual_controls": manual_controls.to_dict(),
+        "current_states": {
+            "pump_running": sensor_generator.tank_states["tank_a"]["pump_running"],
+            "chlorinator_running": sensor_generator.tank_states["tank_b"]["chlorinator_running"],
+        },
+        "modes": {
+            "pump": "MANUAL" if manual_controls.pump_manual_mode else "AUTOMATIC",
+            "chlorinator": "MANUAL" if manual_controls.chlorinator_manual_mode else "AUTOMATIC",
+        },
+        "last_actions": manual_controls.last_actions(),
+    }
+
+
+def build_readings_payload() -> Dict[str, Any]:
+    """Armar la respuesta por defecto de /api/readings (filas, todos los campos)"""
+    return {
+        "success": True,
+        "timestamp": last_update,
+        "format": "rows",
+        "readings": latest_readings_cache,
+        "tanks_count": len(latest_readings_cache),
+        "control_modes": {
+            "pump_mode": "manual" if manual_controls.pump_manual_mode else "automatic",
+            "chlorinator_mode": "manual" if manual_controls.chlorinator_manual_mode else "automatic",
+        },
+    }
+
+
+def rebuild_status_payloads() -> None:
+    """Recalcular respuestas de estado; solo cambian al refrescar lecturas o controles"""
+    global latest_status_payload, latest_control_status_payload, latest_readings_blob
+
+    latest_status_payload = build_system_status_payload()
+    latest_control_status_payload = build_control_status_payload()
+    latest_readings_blob = orjson.dumps(build_readings_payload())
+
+
+async def notify_controls_changed(now: datetime) -> List[Dict[str, Any]]:
+    """
+    Propagar un cambio manual: generador, respuestas de estado, suscriptores SSE y actualizador
+    Devuelve el snapshot publicado, para reutilizarlo en la respuesta del control
+    """
+    sync_controls_to_generator()
+    # Snapshot sin avanzar la simulación: ni tick extra ni lectura extra en el histórico
+    readings = snapshot_readings(now)
+    install_readings(readings, now)
+    publish_readings(readings, now)
+    readings_event.set()
+    return readings
+
+
+async def persist_pending_readings() -> None:
+    """Insertar en lote las lecturas acumuladas (fuera del event loop)"""
+    global pending_readings
+
+    if not pending_readings:
+        return
+
+    batch, pending_readings = pending_readings, []
+    await asyncio.to_thread(flush_readings, batch)
+
+
+async def update_readings_cache() -> None:
+    """
+    Avanzar la simulación cada READINGS_HEARTBEAT_SECONDS
+    El lifespan ya hizo el primer refresco, así que el loop empieza esperando
+    """
+    cycles = 0
+    last_error_logged = float("-inf")
+    suppressed_errors = 0
+    next_tick = time.monotonic() + READINGS_HEARTBEAT_SECONDS
     while True:
         try:
-            apply_manual_controls()
-            latest_readings_cache = get_latest_readings()
-            last_update = datetime.now()
-            await asyncio.sleep(30)
+            if await wait_for_readings_event(next_tick - time.monotonic()):
+                # Cambio de controles: notify_controls_changed ya publicó su snapshot;
+                # se sigue esperando el mismo tick (los clicks no aceleran ni frenan la simulación)
+                continue
 
-        except Exception as e:
-            # Importante: no matar el loop por un error puntual
-            print(f"❌ Error actualizando cache: {e}")
-            await asyncio.sleep(5)
+            next_tick = time.monotonic() + READINGS_HEARTBEAT_SECONDS
+            refresh_readings_cache()
+
+            cycles += 1
+            if cycles % READINGS_FLUSH_CYCLES == 0:
+                await persist_pending_readings()
+
+        except Exception:
+            # Importante: no matar el loop por un error puntual (ni inundar el log)
+            if time.monotonic() - last_error_logged >= CACHE_ERROR_LOG_INTERVAL:
+                logger.exception("Error actualizando cache (%d errores omitidos desde el último log)", suppressed_errors)
+                last_error_logged = time.monotonic()
+                suppressed_errors = 0
+            else:
+                suppressed_errors += 1
+            await asyncio.sleep(CACHE_ERROR_RETRY_SECONDS)
 
 
 # =================== LIFESPAN ===================
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global latest_readings_cache, last_update
+    global readings_event
+
+    log_listener.start()
+
+    # Cache de respuestas: Redis si hay REDIS_URL, si no en memoria del proceso
+    redis_url = os.environ.get("REDIS_URL", "").strip()
+    if redis_url:
+        from fastapi_cache.backends.redis import RedisBackend
+        from redis import asyncio as aioredis
+
+        FastAPICache.init(RedisBackend(aioredis.from_url(redis_url)), prefix="asadas", coder=ORJSONCoder)
+    else:
+        FastAPICache.init(InMemoryBackend(), prefix="asadas", coder=ORJSONCoder)
+
+    # Base de datos para el histórico de lecturas
+    await asyncio.to_thread(startup_database)
 
     # Inicializar cache
-    latest_readings_cache = get_latest_readings()
-    last_update = datetime.now()
+    refresh_readings_cache()
 
-    # Iniciar tarea en segundo plano
+    # Iniciar tarea en segundo plano, con una señal ligada a este loop
+    readings_event = asyncio.Event()
     task = asyncio.create_task(update_readings_cache())
     try:
         yield
@@ -98,6 +515,9 @@ async def lifespan(app: FastAPI):
             await task
         except asyncio.CancelledError:
             pass
+        # No perder el último lote al apagar
+        await persist_pending_readings()
+        log_listener.stop()
 
 
 # =================== APP FASTAPI ===================
@@ -109,8 +529,45 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,  # orjson serializa datetime a ISO-8601
 )
 
+# =================== HORA DE LA PETICIÓN ===================
+
+class RequestTimeMiddleware:
+    """
+    Middleware ASGI que fija una sola marca de tiempo por petición
+    (request.state.now) para todos los timestamps de la respuesta
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["now"] = datetime.now()
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(RequestTimeMiddleware)
+
+# Compresión gzip para respuestas grandes (p.ej. /api/history de 168 h); las chicas van sin comprimir.
+# Starlette no comprime text/event-stream, así que /api/events sigue empujando cada evento al instante
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+
+# =================== ERRORES DE VALIDACIÓN ===================
+# Parámetros inválidos (tank_id, hours, format) se rechazan antes del handler;
+# se mantiene la forma histórica de error: 400 + {"detail": "<mensaje>"}
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    detail = "; ".join(
+        f"{error['loc'][-1]}: {error['msg']}" for error in exc.errors()
+    )
+    return ORJSONResponse(status_code=400, content={"detail": detail})
+
+
 # =================== CORS (cloud-safe) ===================
 # Regla: si allow_credentials=True, NO se permite allow_origins=["*"].
 # Usamos FRONTEND_ORIGINS si existe; si no, usamos tu Reflex URL + localhost.
@@ -125,58 +582,52 @@ if not allowed_origins:
         "http://127.0.0.1:3000",
     ]
 
+# Métodos y headers explícitos: el preflight es un chequeo de pertenencia, sin comodines
+# max_age: el navegador reutiliza el preflight 24 h en lugar de repetir el OPTIONS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=allowed_origins,
+    allow_origins=frozenset(allowed_origins),
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "authorization"],
+    max_age=86400,
 )
 
 
 # =================== ENDPOINTS ===================
 
 @app.get("/")
-async def root():
+async def root(request: Request):
     return {
-        "message": "Asada Tsa Diglo Wak - Sistema de Monitoreo y Control de Tanques",
-        "version": "2.0.0",
-        "system": "Tanque A (Cisterna) + Tanque B (150m³)",
-        "features": [
-            "Monitoreo de nivel de agua en tiempo real",
-            "Control automático y manual de bombeo",
-            "Control automático y manual de cloración",
-            "Sistema de alertas inteligente",
-            "Datos históricos para análisis con IA",
-        ],
-        "control_endpoints": {
-            "pump_on": "POST /api/control/pump/on",
-            "pump_off": "POST /api/control/pump/off",
-            "chlorinator_on": "POST /api/control/chlorinator/on",
-            "chlorinator_off": "POST /api/control/chlorinator/off",
-            "auto_mode": "POST /api/control/auto",
-        },
-        "monitoring_endpoints": {
-            "current_readings": "GET /api/readings",
-            "system_status": "GET /api/status",
-            "control_status": "GET /api/control/status",
-        },
-        "timestamp": iso(datetime.now()),
+        **ROOT_RESPONSE_STATIC,
+        "timestamp": request.state.now,
         "status": "operational",
     }
 
 
 @app.get("/api/readings")
-async def get_current_readings():
+async def get_current_readings(
+    response_format: str = FORMAT_QUERY,
+    fields: Optional[str] = FIELDS_QUERY,
+):
     try:
+        # Caso por defecto: bytes serializados una vez por refresco (sin codificar por petición)
+        if response_format == "rows" and not fields:
+            return Response(content=latest_readings_blob, media_type="application/json")
+
+        readings = project_fields(latest_readings_cache, fields)
+        if response_format == "columnar":
+            readings = to_columnar(readings)
+
         return {
             "success": True,
-            "timestamp": iso(last_update),
-            "readings": latest_readings_cache,
+            "timestamp": last_update,
+            "format": response_format,
+            "readings": readings,
             "tanks_count": len(latest_readings_cache),
             "control_modes": {
-                "pump_mode": "manual" if manual_controls["pump_manual_mode"] else "automatic",
-                "chlorinator_mode": "manual" if manual_controls["chlorinator_manual_mode"] else "automatic",
+                "pump_mode": "manual" if manual_controls.pump_manual_mode else "automatic",
+                "chlorinator_mode": "manual" if manual_controls.chlorinator_manual_mode else "automatic",
             },
         }
     except Exception as e:
@@ -184,115 +635,22 @@ async def get_current_readings():
 
 
 @app.get("/api/tank/{tank_id}")
-async def get_tank_data(tank_id: str):
-    if tank_id not in ["tank_a", "tank_b"]:
-        raise HTTPException(status_code=400, detail="tank_id debe ser 'tank_a' o 'tank_b'")
-
+async def get_tank_data(request: Request, tank_id: Literal["tank_a", "tank_b"]):
     try:
-        for reading in latest_readings_cache:
-            if reading.get("tank_id") == tank_id:
-                return {"success": True, "timestamp": iso(datetime.now()), "tank": reading}
-
-        reading = get_tank_reading(tank_id)
-        return {"success": True, "timestamp": iso(datetime.now()), "tank": reading}
+        reading = latest_readings_by_id.get(tank_id)
+        if reading is None:
+            reading = get_tank_reading(tank_id)
+        return {"success": True, "timestamp": request.state.now, "tank": reading}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo datos del tanque: {str(e)}")
 
 
+# Sin @cache: el payload ya está precalculado en memoria y el timestamp es el de cada request
 @app.get("/api/status")
-async def get_system_status():
+async def get_system_status(request: Request):
     try:
-        tank_a_data = None
-        tank_b_data = None
-
-        for reading in latest_readings_cache:
-            if reading.get("tank_id") == "tank_a":
-                tank_a_data = reading
-            elif reading.get("tank_id") == "tank_b":
-                tank_b_data = reading
-
-        alerts = []
-
-        if tank_a_data:
-            level_percent = tank_a_data["water_level_percent"]
-            if level_percent < 20:
-                alerts.append({
-                    "type": "low_water",
-                    "tank": "tank_a",
-                    "severity": "high",
-                    "message": f"Nivel bajo en Cisterna: {level_percent}%",
-                    "action_required": "Verificar captaciones de agua"
-                })
-            elif level_percent > 90:
-                alerts.append({
-                    "type": "high_water",
-                    "tank": "tank_a",
-                    "severity": "medium",
-                    "message": f"Cisterna casi llena: {level_percent}%",
-                    "action_required": "Bomba debería activarse automáticamente"
-                })
-
-        if tank_b_data:
-            level_percent = tank_b_data["water_level_percent"]
-            if level_percent < 25:
-                alerts.append({
-                    "type": "low_water",
-                    "tank": "tank_b",
-                    "severity": "critical",
-                    "message": f"Nivel crítico en Tanque 150: {level_percent}%",
-                    "action_required": "Activar bomba manualmente si es necesario"
-                })
-
-            chlorine = tank_b_data.get("chlorine_ppm")
-            if chlorine is not None:
-                if chlorine < 0.5:
-                    alerts.append({
-                        "type": "low_chlorine",
-                        "tank": "tank_b",
-                        "severity": "high",
-                        "message": f"Cloro bajo: {chlorine} ppm",
-                        "action_required": "Activar clorador manualmente"
-                    })
-                elif chlorine > 2.0:
-                    alerts.append({
-                        "type": "high_chlorine",
-                        "tank": "tank_b",
-                        "severity": "medium",
-                        "message": f"Cloro alto: {chlorine} ppm",
-                        "action_required": "Detener clorador temporalmente"
-                    })
-
-        return {
-            "success": True,
-            "timestamp": iso(datetime.now()),
-            "system_operational": True,
-            "tanks_online": len(latest_readings_cache),
-            "last_reading": iso(last_update),
-            "alerts": alerts,
-            "alerts_count": len(alerts),
-            "control_status": manual_controls,
-            "tank_summary": {
-                "tank_a": {
-                    "name": "Cisterna",
-                    "level_percent": tank_a_data["water_level_percent"] if tank_a_data else 0,
-                    "level_cm": tank_a_data["water_level_cm"] if tank_a_data else 0,
-                    "volume_m3": tank_a_data["water_volume_m3"] if tank_a_data else 0,
-                    "pump_running": tank_a_data["pump_status"] if tank_a_data else False,
-                    "pump_mode": "manual" if manual_controls["pump_manual_mode"] else "automatic",
-                } if tank_a_data else None,
-                "tank_b": {
-                    "name": "Tanque 150",
-                    "level_percent": tank_b_data["water_level_percent"] if tank_b_data else 0,
-                    "level_cm": tank_b_data["water_level_cm"] if tank_b_data else 0,
-                    "volume_m3": tank_b_data["water_volume_m3"] if tank_b_data else 0,
-                    "chlorine_ppm": tank_b_data.get("chlorine_ppm", 0) if tank_b_data else 0,
-                    "chlorine_status": tank_b_data.get("chlorine_status", "unknown") if tank_b_data else "unknown",
-                    "chlorinator_running": tank_b_data.get("chlorinator_status", False) if tank_b_data else False,
-                    "chlorinator_mode": "manual" if manual_controls["chlorinator_manual_mode"] else "automatic",
-                } if tank_b_data else None,
-            },
-        }
+        return {**latest_status_payload, "timestamp": request.state.now}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo estado del sistema: {str(e)}")
@@ -300,184 +658,153 @@ async def get_system_status():
 
 # =================== CONTROLES MANUALES ===================
 
-@app.post("/api/control/pump/on")
-async def turn_pump_on():
-    try:
-        manual_controls["pump_manual_mode"] = True
-        manual_controls["pump_manual_state"] = True
-        manual_controls["last_manual_action"]["pump"] = {
-            "action": "turn_on",
-            "timestamp": iso(datetime.now()),
-            "user": "manual_control",
-        }
-        sensor_generator.tank_states[TankType.TANK_A]["pump_running"] = True
-
-        return {
-            "success": True,
-            "timestamp": iso(datetime.now()),
-            "message": "🟢 BOMBA ENCENDIDA MANUALMENTE",
-            "pump_status": "ON",
-            "mode": "MANUAL",
-        }
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error encendiendo bomba: {str(e)}")
-
-
-@app.post("/api/control/pump/off")
-async def turn_pump_off():
-    try:
-        manual_controls["pump_manual_mode"] = True
-        manual_controls["pump_manual_state"] = False
-        manual_controls["last_manual_action"]["pump"] = {
-            "action": "turn_off",
-            "timestamp": iso(datetime.now()),
-            "user": "manual_control",
-        }
-        sensor_generator.tank_states[TankType.TANK_A]["pump_running"] = False
-
-        return {
-            "success": True,
-            "timestamp": iso(datetime.now()),
-            "message": "🔴 BOMBA APAGADA MANUALMENTE",
-            "pump_status": "OFF",
-            "mode": "MANUAL",
-        }
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error apagando bomba: {str(e)}")
-
-
-@app.post("/api/control/chlorinator/on")
-async def turn_chlorinator_on():
-    try:
-        manual_controls["chlorinator_manual_mode"] = True
-        manual_controls["chlorinator_manual_state"] = True
-        manual_controls["last_manual_action"]["chlorinator"] = {
-            "action": "turn_on",
-            "timestamp": iso(datetime.now()),
-            "user": "manual_control",
-        }
-        sensor_generator.tank_states[TankType.TANK_B]["chlorinator_running"] = True
-
-        return {
-            "success": True,
-            "timestamp": iso(datetime.now()),
-            "message": "🟢 CLORADOR ENCENDIDO MANUALMENTE",
-            "chlorinator_status": "ON",
-            "mode": "MANUAL",
-        }
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error encendiendo clorador: {str(e)}")
+# Equipos con control manual: textos de la respuesta.
+# Los campos de ManualControls siguen el patrón {device}_manual_mode / {device}_manual_state / last_{device}_action
+DEVICE_CONTROLS: Dict[str, Dict[str, Any]] = {
+    "pump": {
+        "name": "bomba",
+        "messages": {"on": "🟢 BOMBA ENCENDIDA MANUALMENTE", "off": "🔴 BOMBA APAGADA MANUALMENTE"},
+    },
+    "chlorinator": {
+        "name": "clorador",
+        "messages": {"on": "🟢 CLORADOR ENCENDIDO MANUALMENTE", "off": "🔴 CLORADOR APAGADO MANUALMENTE"},
+    },
+}
 
 
-@app.post("/api/control/chlorinator/off")
-async def turn_chlorinator_off():
+@app.post("/api/control/{device}/{action}")
+async def set_device_state(
+    request: Request,
+    device: Literal["pump", "chlorinator"],
+    action: Literal["on", "off"],
+):
+    """Encender/apagar manualmente la bomba o el clorador (una sola ruta para los cuatro casos)"""
+    control = DEVICE_CONTROLS[device]
+    running = action == "on"
     try:
-        manual_controls["chlorinator_manual_mode"] = True
-        manual_controls["chlorinator_manual_state"] = False
-        manual_controls["last_manual_action"]["chlorinator"] = {
-            "action": "turn_off",
-            "timestamp": iso(datetime.now()),
+        setattr(manual_controls, f"{device}_manual_mode", True)
+        setattr(manual_controls, f"{device}_manual_state", running)
+        setattr(manual_controls, f"last_{device}_action", {
+            "action": f"turn_{action}",
+            "timestamp": request.state.now,
             "user": "manual_control",
-        }
-        sensor_generator.tank_states[TankType.TANK_B]["chlorinator_running"] = False
+        })
+        readings = await notify_controls_changed(request.state.now)
 
         return {
             "success": True,
-            "timestamp": iso(datetime.now()),
-            "message": "🔴 CLORADOR APAGADO MANUALMENTE",
-            "chlorinator_status": "OFF",
+            "timestamp": request.state.now,
+            "message": control["messages"][action],
+            f"{device}_status": "ON" if running else "OFF",
             "mode": "MANUAL",
+            "readings": readings,
         }
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error apagando clorador: {str(e)}")
+        verb = "encendiendo" if running else "apagando"
+        raise HTTPException(status_code=500, detail=f"Error {verb} {control['name']}: {str(e)}")
 
 
 @app.post("/api/control/auto")
-async def set_automatic_mode():
+async def set_automatic_mode(request: Request):
     try:
-        manual_controls["pump_manual_mode"] = False
-        manual_controls["chlorinator_manual_mode"] = False
-        manual_controls["last_manual_action"]["pump"] = {
+        manual_controls.pump_manual_mode = False
+        manual_controls.chlorinator_manual_mode = False
+        manual_controls.last_pump_action = {
             "action": "set_automatic",
-            "timestamp": iso(datetime.now()),
+            "timestamp": request.state.now,
             "user": "manual_control",
         }
-        manual_controls["last_manual_action"]["chlorinator"] = {
+        manual_controls.last_chlorinator_action = {
             "action": "set_automatic",
-            "timestamp": iso(datetime.now()),
+            "timestamp": request.state.now,
             "user": "manual_control",
         }
 
+        readings = await notify_controls_changed(request.state.now)
+
         return {
             "success": True,
-            "timestamp": iso(datetime.now()),
+            "timestamp": request.state.now,
             "message": "🤖 MODO AUTOMÁTICO ACTIVADO",
             "pump_mode": "AUTOMATIC",
             "chlorinator_mode": "AUTOMATIC",
+            "readings": readings,
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error activando modo automático: {str(e)}")
 
 
+class ControlRequest(BaseModel):
+    action: Literal["pump_on", "pump_off", "chlorinator_on", "chlorinator_off", "auto_mode"]
+
+
+@app.post("/api/control")
+async def run_control_action(request: Request, body: ControlRequest):
+    """Endpoint único de control: responde el ack y las lecturas nuevas en un solo round-trip"""
+    if body.action == "auto_mode":
+        return await set_automatic_mode(request)
+    device, action = body.action.rsplit("_", 1)
+    return await set_device_state(request, device, action)
+
+
 @app.get("/api/control/status")
-async def get_control_status():
+async def get_control_status(request: Request):
+    try:
+        return {**latest_control_status_payload, "timestamp": request.state.now}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error obteniendo estado de controles: {str(e)}")
+
+
+@app.get("/api/dashboard")
+async def get_dashboard(request: Request):
+    """Lecturas + estado del sistema + controles en un solo round-trip (payloads ya precalculados)"""
     try:
         return {
             "success": True,
-            "timestamp": iso(datetime.now()),
-            "manual_controls": manual_controls,
-            "current_states": {
-                "pump_running": sensor_generator.tank_states[TankType.TANK_A]["pump_running"],
-                "chlorinator_running": sensor_generator.tank_states[TankType.TANK_B]["chlorinator_running"],
-            },
-            "modes": {
-                "pump": "MANUAL" if manual_controls["pump_manual_mode"] else "AUTOMATIC",
-                "chlorinator": "MANUAL" if manual_controls["chlorinator_manual_mode"] else "AUTOMATIC",
-            },
-            "last_actions": manual_controls["last_manual_action"],
+            "timestamp": request.state.now,
+            "last_update": last_update,
+            "readings": latest_readings_cache,
+            "status": latest_status_payload,
+            "control": latest_control_status_payload,
         }
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error obteniendo estado de controles: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error obteniendo datos del dashboard: {str(e)}")
 
 
 # =================== ENDPOINTS ADICIONALES ===================
 
 @app.get("/api/history")
-async def get_historical_data(hours: int = 24):
-    if hours > 168:
-        hours = 168
-
+@cache(expire=60)
+async def get_historical_data(
+    request: Request,
+    hours: int = Query(24, ge=1, le=168),
+    response_format: str = FORMAT_QUERY,
+):
     try:
-        historical_data = []
-        now = datetime.now()
-        points = hours * 2
-
-        for i in range(points):
-            timestamp = now - timedelta(minutes=30 * i)
-            base_level_a = 120 + 10 * (i % 10) / 10
-            base_level_b = 200 + 15 * (i % 8) / 8
-            base_chlorine = 1.2 + 0.3 * (i % 6) / 6
-
-            historical_data.append({
-                "timestamp": iso(timestamp),
-                "tank_a_level_cm": round(base_level_a, 2),
-                "tank_a_level_percent": round((base_level_a / 180) * 100, 1),
-                "tank_b_level_cm": round(base_level_b, 2),
-                "tank_b_level_percent": round((base_level_b / 300) * 100, 1),
-                "chlorine_ppm": round(base_chlorine, 3),
-            })
+        now = request.state.now
+
+        # Con TimescaleDB se sirve el rollup materializado; si no, datos simulados
+        columns = await asyncio.to_thread(get_history_rollup, hours)
+        if not columns or not columns["timestamp"]:
+            columns = simulated_history_columns(now, hours)
+        points = len(columns["timestamp"])
+
+        if response_format == "columnar":
+            historical_data = columns
+        else:
+            keys = tuple(columns)
+            historical_data = [dict(zip(keys, row)) for row in zip(*columns.values())]
 
         return {
             "success": True,
-            "timestamp": iso(datetime.now()),
+            "timestamp": now,
             "hours_requested": hours,
-            "data_points": len(historical_data),
+            "data_points": points,
+            "format": response_format,
             "data": historical_data,
         }
 
@@ -486,39 +813,52 @@ async def get_historical_data(hours: int = 24):
 
 
 @app.get("/api/config")
-async def get_tank_configurations():
+async def get_tank_configurations(request: Request):
     try:
-        configs = {}
-        for tank_type, config in TANK_CONFIGS.items():
-            configs[tank_type.value] = {
-                "tank_id": config.tank_id,
-                "name": config.name,
-                "capacity_m3": config.capacity_m3,
-                "max_height_cm": config.max_height_cm,
-                "min_height_cm": config.min_height_cm,
-                "has_chlorine_sensor": config.has_chlorine_sensor,
-                "normal_consumption_rate": config.normal_consumption_rate,
-            }
-
         return {
             "success": True,
-            "timestamp": iso(datetime.now()),
-            "configurations": configs,
+            "timestamp": request.state.now,
+            "configurations": TANK_CONFIG_RESPONSE,
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo configuraciones: {str(e)}")
 
 
+@app.get("/api/events")
+async def stream_events(request: Request):
+    """Server-Sent Events: lecturas en cada refresco del cache o cambio de controles"""
+    subscriber: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=10)
+    event_subscribers.add(subscriber)
+
+    async def event_stream():
+        try:
+            # Estado actual al conectar, sin esperar al próximo refresco
+            yield b"data: " + orjson.dumps({"timestamp": last_update, "readings": latest_readings_cache}) + b"\n\n"
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(subscriber.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+        finally:
+            event_subscribers.discard(subscriber)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/health")
-async def health_check():
+async def health_check(request: Request):
     return {
         "status": "healthy",
-        "timestamp": iso(datetime.now()),
+        "timestamp": request.state.now,
         "api_version": "2.0.0",
-        "cache_updated": iso(last_update),
+        "cache_updated": last_update,
         "readings_cached": len(latest_readings_cache),
-        "manual_controls_active": manual_controls["pump_manual_mode"] or manual_controls["chlorinator_manual_mode"],
+        "manual_controls_active": manual_controls.pump_manual_mode or manual_controls.chlorinator_manual_mode,
     }
 
 
@@ -527,11 +867,16 @@ async def health_check():
 def run_server():
     """Ejecutar servidor (local o cloud si lo usan como entrypoint)"""
     port = int(os.environ.get("PORT", "8000"))
+    # ⚠️ Cada worker tiene su propia simulación y controles manuales en memoria:
+    # subir WEB_CONCURRENCY solo si el estado se comparte fuera del proceso
+    workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=port,
-        reload=False,  # ✅ en cloud NO
+        loop="asyncio" if sys.platform == "win32" else "uvloop",  # uvloop no existe en Windows
+        http="httptools",
+        workers=workers,
         log_level="info",
     )
 
@@ -2,19 +2,128 @@
 Dashboard para Sistema Asada Tsa Diglo Wak
 Reflex 0.8.4
 - API_BASE_URL por variable de entorno (para cloud)
-- Requests con timeout
+- Requests async con timeout (httpx)
 """
 
+import asyncio
+import contextlib
 import os
+import time
+import httpx
+import orjson
 import reflex as rx
-import requests
-from datetime import datetime
 
 # ✅ API base URL:
 # - Local: http://localhost:8000
 # - Cloud: setear en Reflex Cloud (Settings -> Environment Variables)
 API_BASE_URL = os.getenv("API_BASE_URL", "").rstrip("/")
 
+# ✅ Cliente HTTP async compartido: keep-alive + pool de conexiones, sin bloquear el event loop
+# El transporte reintenta una vez los fallos de conexión (un socket keep-alive cerrado por el servidor)
+CLIENT = httpx.AsyncClient(
+    base_url=API_BASE_URL,
+    timeout=httpx.Timeout(8.0, connect=2.0),
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=1,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+    ),
+)
+
+
+# Rutas de la API (relativas a CLIENT.base_url)
+URL_HEALTH = "/health"
+URL_READINGS = "/api/readings"
+URL_CONTROL = "/api/control"
+URL_EVENTS = "/api/events"
+
+# Proyección: solo los campos que el dashboard muestra (menos bytes y menos parseo)
+READINGS_PARAMS = {
+    "fields": "tank_id,water_level_cm,water_level_percent,water_volume_m3,"
+              "pump_status,chlorine_ppm,chlorine_status,chlorinator_status",
+}
+
+# Reintento de la suscripción SSE: backoff exponencial mientras la API no responde
+EVENTS_RETRY_MIN_SECONDS = 3
+EVENTS_RETRY_MAX_SECONDS = 30
+
+# Tras un error de conexión, los handlers fallan rápido durante esta ventana
+API_FAIL_COOLDOWN = 2.0  # segundos
+
+# Stale-while-revalidate de la última lectura:
+# - edad < READINGS_CACHE_TTL: se reutiliza sin tocar la red
+# - edad < READINGS_STALE_TTL: se mantiene en pantalla y se revalida en segundo plano
+# - más vieja: request bloqueante con spinner
+READINGS_CACHE_TTL = 3.0  # segundos
+READINGS_STALE_TTL = 15.0  # segundos
+
+
+# Acciones de control: acción -> (mensaje de éxito, mensaje de error)
+CONTROL_MESSAGES = {
+    "pump_on": ("🟢 Bomba encendida exitosamente", "❌ Error encendiendo bomba"),
+    "pump_off": ("🔴 Bomba apagada exitosamente", "❌ Error apagando bomba"),
+    "chlorinator_on": ("🟢 Clorador encendido exitosamente", "❌ Error encendiendo clorador"),
+    "chlorinator_off": ("🔴 Clorador apagado exitosamente", "❌ Error apagando clorador"),
+    "auto_mode": ("🤖 Modo automático activado", "❌ Error activando modo automático"),
+}
+
+# Campos de cada lectura que se copian al estado: (atributo, clave en la lectura, conversión, default)
+# A nivel de módulo: dentro de rx.State un atributo "_..." sería una variable de backend por sesión
+TANK_A_FIELDS = (
+    ("tank_a_level", "water_level_cm", float, 0.0),
+    ("tank_a_percent", "water_level_percent", float, 0.0),
+    ("tank_a_volume", "water_volume_m3", float, 0.0),
+    ("pump_status", "pump_status", bool, False),
+)
+TANK_B_FIELDS = (
+    ("tank_b_level", "water_level_cm", float, 0.0),
+    ("tank_b_percent", "water_level_percent", float, 0.0),
+    ("tank_b_volume", "water_volume_m3", float, 0.0),
+    ("chlorine_ppm", "chlorine_ppm", float, 0.0),
+    ("chlorine_status", "chlorine_status", str, "unknown"),
+    ("chlorinator_status", "chlorinator_status", bool, False),
+)
+
+# =================== ESTILOS ===================
+# Diccionarios de estilo compartidos (se construyen una sola vez al importar)
+LABEL_STYLE = dict(color="rgba(255,255,255,0.8)", font_size="0.9em")
+VALUE_STYLE = dict(color="white", font_size="1.4em", font_weight="bold")
+SECTION_STYLE = dict(border_top="1px solid rgba(255,255,255,0.2)", padding_top="1rem")
+ON_STYLE = dict(color="#4ade80", font_weight="bold")
+OFF_STYLE = dict(color="#ef4444", font_weight="bold")
+BTN_STYLE = dict(color="white", size="3", width="90%", border="1px solid rgba(255,255,255,0.2)")
+BTN_GREEN = "rgba(34, 197, 94, 0.8)"
+BTN_RED = "rgba(239, 68, 68, 0.8)"
+BTN_BLUE = "rgba(59, 130, 246, 0.8)"
+CARD_STYLE = dict(
+    align_items="center",
+    spacing="3",
+    padding="1.5rem",
+    bg="rgba(0, 0, 0, 0.2)",
+    border="1px solid rgba(255,255,255,0.1)",
+    border_radius="12px",
+    height="400px",
+)
+
+
+@contextlib.asynccontextmanager
+async def api_client_lifespan():
+    """Abrir la conexión con la API al iniciar (el primer click no paga el handshake) y cerrarla al salir"""
+    try:
+        await CLIENT.get(URL_HEALTH)
+    except Exception:
+        pass
+    try:
+        yield
+    finally:
+        await CLIENT.aclose()
+
+
+def session_connected(token: str) -> bool:
+    """La pestaña sigue abierta: Reflex quita el token de token_to_sid al desconectarse el websocket"""
+    namespace = app.event_namespace
+    return namespace is not None and token in namespace.token_to_sid
+
 
 class DashboardState(rx.State):
     """Estado principal del dashboard"""
@@ -36,38 +145,114 @@ class DashboardState(rx.State):
     api_connected: bool = False
     last_update: str = ""
     loading: bool = False
-    message: str = "Presiona 'Cargar Datos' para comenzar"
+    message: str = "Cargando datos..."
+
+    # Backend-only: momento (monotonic) de la última lectura aplicada (GET, control o SSE)
+    _last_fetch_ts: float = 0.0
+    # Backend-only: hay una suscripción SSE activa para esta sesión
+    _subscribed: bool = False
+    # Backend-only: momento (monotonic) del último error de conexión
+    _last_fail_ts: float = 0.0
+
+    # =================== TEXTOS PRECALCULADOS ===================
+    # Un string por valor mostrado: un solo campo en cada diff de estado
+
+    @rx.var
+    def tank_a_nivel_text(self) -> str:
+        return f"Nivel: {self.tank_a_percent:.1f}%"
+
+    @rx.var
+    def tank_a_altura_text(self) -> str:
+        return f"Altura: {self.tank_a_level:.1f} cm"
+
+    @rx.var
+    def tank_a_volumen_text(self) -> str:
+        return f"Volumen: {self.tank_a_volume:.1f} m³"
+
+    @rx.var
+    def tank_b_nivel_text(self) -> str:
+        return f"Nivel: {self.tank_b_percent:.1f}%"
 
-    def load_data(self):
+    @rx.var
+    def tank_b_altura_text(self) -> str:
+        return f"Altura: {self.tank_b_level:.1f} cm"
+
+    @rx.var
+    def tank_b_volumen_text(self) -> str:
+        return f"Volumen: {self.tank_b_volume:.1f} m³"
+
+    @rx.var
+    def chlorine_text(self) -> str:
+        return f"Cloro: {self.chlorine_ppm:.2f} ppm ({self.chlorine_status})"
+
+    def _apply_readings(self, readings: list):
+        """Copiar al estado los campos de las lecturas de ambos tanques"""
+        by_id = {r.get("tank_id"): r for r in readings}
+
+        for tank_id, fields in (("tank_a", TANK_A_FIELDS), ("tank_b", TANK_B_FIELDS)):
+            reading = by_id.get(tank_id)
+            if reading:
+                for attr, key, conv, default in fields:
+                    setattr(self, attr, conv(reading.get(key) or default))
+
+        self.api_connected = True
+        self.last_update = time.strftime("%H:%M:%S")
+        self._last_fetch_ts = time.monotonic()
+
+    async def _apply_control_response(self, response: httpx.Response):
+        """Usar las lecturas que devuelve el endpoint de control (1 solo round-trip)"""
+        readings = orjson.loads(response.content).get("readings")
+        if readings is None:
+            await self._refresh(force=True)
+        else:
+            self._apply_readings(readings)
+
+    def _in_cooldown(self) -> bool:
+        """Circuit breaker: la API falló hace menos de API_FAIL_COOLDOWN segundos"""
+        if time.monotonic() - self._last_fail_ts < API_FAIL_COOLDOWN:
+            self.message = "❌ API en cooldown"
+            return True
+        return False
+
+    async def load_data(self):
         """Cargar datos de la API"""
+        age = time.monotonic() - self._last_fetch_ts
+        if age < READINGS_CACHE_TTL:
+            return
+        # Con la suscripción SSE activa los datos ya llegan solos: el botón solo revalida, sin bloquear
+        if self._subscribed or age < READINGS_STALE_TTL:
+            return DashboardState.revalidate_readings
+        await self._refresh()
+
+    @rx.event(background=True)
+    async def revalidate_readings(self):
+        """Refrescar la lectura en segundo plano; ante un error se conserva lo que hay en pantalla"""
+        try:
+            response = await CLIENT.get(URL_READINGS, params=READINGS_PARAMS)
+            data = orjson.loads(response.content) if response.status_code == 200 else {}
+        except Exception:
+            return
+
+        if data.get("success"):
+            async with self:
+                self._apply_readings(data.get("readings", []))
+
+    async def _refresh(self, force: bool = False):
+        """Pedir /api/readings, salvo que la última lectura tenga menos de READINGS_CACHE_TTL"""
+        if not force and time.monotonic() - self._last_fetch_ts < READINGS_CACHE_TTL:
+            return
+        if self._in_cooldown():
+            return
+
         self.loading = True
         try:
-            url = f"{API_BASE_URL}/api/readings"
-            response = requests.get(url, timeout=8)
+            response = await CLIENT.get(URL_READINGS, params=READINGS_PARAMS)
 
             if response.status_code == 200:
-                data = response.json()
+                data = orjson.loads(response.content)
 
                 if data.get("success"):
-                    readings = data.get("readings", [])
-
-                    for reading in readings:
-                        if reading.get("tank_id") == "tank_a":
-                            self.tank_a_level = float(reading.get("water_level_cm", 0) or 0)
-                            self.tank_a_percent = float(reading.get("water_level_percent", 0) or 0)
-                            self.tank_a_volume = float(reading.get("water_volume_m3", 0) or 0)
-                            self.pump_status = bool(reading.get("pump_status", False))
-
-                        elif reading.get("tank_id") == "tank_b":
-                            self.tank_b_level = float(reading.get("water_level_cm", 0) or 0)
-                            self.tank_b_percent = float(reading.get("water_level_percent", 0) or 0)
-                            self.tank_b_volume = float(reading.get("water_volume_m3", 0) or 0)
-                            self.chlorine_ppm = float(reading.get("chlorine_ppm", 0) or 0)
-                            self.chlorine_status = str(reading.get("chlorine_status", "unknown"))
-                            self.chlorinator_status = bool(reading.get("chlorinator_status", False))
-
-                    self.api_connected = True
-                    self.last_update = datetime.now().strftime("%H:%M:%S")
+                    self._apply_readings(data.get("readings", []))
                     self.message = "✅ Datos actualizados correctamente"
                 else:
                     self.api_connected = False
@@ -78,112 +263,133 @@ class DashboardState(rx.State):
                 self.message = f"❌ Error HTTP: {response.status_code}"
 
         except Exception as e:
+            self._last_fail_ts = time.monotonic()
             self.api_connected = False
             self.message = f"❌ Error de conexión: {str(e)}"
 
-        self.loading = False
+        finally:
+            self.loading = False
 
-    def pump_on(self):
-        try:
-            response = requests.post(f"{API_BASE_URL}/api/control/pump/on", timeout=8)
-            if response.status_code == 200:
-                self.message = "🟢 Bomba encendida exitosamente"
-                self.load_data()
-            else:
-                self.message = f"❌ Error encendiendo bomba ({response.status_code})"
-        except Exception as e:
-            self.message = f"❌ Error: {str(e)}"
+    @rx.event(background=True)
+    async def subscribe_updates(self):
+        """Recibir lecturas por SSE (push) en lugar de consultar la API"""
+        async with self:
+            # Un solo loop por sesión aunque on_load se dispare otra vez
+            if self._subscribed:
+                return
+            self._subscribed = True
+            token = self.router.session.client_token
 
-    def pump_off(self):
-        try:
-            response = requests.post(f"{API_BASE_URL}/api/control/pump/off", timeout=8)
-            if response.status_code == 200:
-                self.message = "🔴 Bomba apagada exitosamente"
-                self.load_data()
-            else:
-                self.message = f"❌ Error apagando bomba ({response.status_code})"
-        except Exception as e:
-            self.message = f"❌ Error: {str(e)}"
+        subscribed = True
 
-    def chlorinator_on(self):
-        try:
-            response = requests.post(f"{API_BASE_URL}/api/control/chlorinator/on", timeout=8)
-            if response.status_code == 200:
-                self.message = "🟢 Clorador encendido exitosamente"
-                self.load_data()
-            else:
-                self.message = f"❌ Error encendiendo clorador ({response.status_code})"
-        except Exception as e:
-            self.message = f"❌ Error: {str(e)}"
+        async def still_connected() -> bool:
+            """Con el lock del estado: si la pestaña se cerró, liberar la suscripción antes de salir"""
+            nonlocal subscribed
+            async with self:
+                if not session_connected(token):
+                    self._subscribed = subscribed = False
+            return subscribed
 
-    def chlorinator_off(self):
+        retry_interval = EVENTS_RETRY_MIN_SECONDS
         try:
-            response = requests.post(f"{API_BASE_URL}/api/control/chlorinator/off", timeout=8)
-            if response.status_code == 200:
-                self.message = "🔴 Clorador apagado exitosamente"
-                self.load_data()
-            else:
-                self.message = f"❌ Error apagando clorador ({response.status_code})"
-        except Exception as e:
-            self.message = f"❌ Error: {str(e)}"
+            while await still_connected():
+                try:
+                    async with CLIENT.stream(
+                        "GET", URL_EVENTS, timeout=httpx.Timeout(8.0, read=None)
+                    ) as response:
+                        response.raise_for_status()
+                        # Conectado: el próximo corte reintenta rápido aunque aún no llegue ningún evento
+                        retry_interval = EVENTS_RETRY_MIN_SECONDS
+                        async for line in response.aiter_lines():
+                            # Cada línea (datos o keepalive) sirve para notar que la pestaña se cerró
+                            if not await still_connected():
+                                return
+                            if not line.startswith("data: "):
+                                continue
+                            readings = orjson.loads(line[6:]).get("readings", [])
+                            async with self:
+                                self._apply_readings(readings)
+                except Exception as e:
+                    async with self:
+                        self.api_connected = False
+                        self.message = f"❌ Error de conexión: {str(e)}"
+                    retry_interval = min(EVENTS_RETRY_MAX_SECONDS, retry_interval * 2)
 
-    def auto_mode(self):
+                await asyncio.sleep(retry_interval)
+        finally:
+            # Cancelación: la suscripción sigue marcada como propia y hay que liberarla
+            if subscribed:
+                async with self:
+                    self._subscribed = False
+
+    async def control(self, action: str):
+        """POST /api/control con la acción y aplicar las lecturas que devuelve"""
+        ok_msg, err_msg = CONTROL_MESSAGES[action]
+        if self._in_cooldown():
+            return
         try:
-            response = requests.post(f"{API_BASE_URL}/api/control/auto", timeout=8)
+            response = await CLIENT.post(URL_CONTROL, json={"action": action})
             if response.status_code == 200:
-                self.message = "🤖 Modo automático activado"
-                self.load_data()
+                self.message = ok_msg
+                await self._apply_control_response(response)
             else:
-                self.message = f"❌ Error activando modo automático ({response.status_code})"
+                self.message = f"{err_msg} ({response.status_code})"
         except Exception as e:
+            self._last_fail_ts = time.monotonic()
             self.message = f"❌ Error: {str(e)}"
 
 
-def dashboard() -> rx.Component:
+@rx.memo
+def dashboard_header() -> rx.Component:
+    """Encabezado estático: se compila una vez y no participa en los diffs de estado"""
     return rx.box(
-        rx.container(
-            rx.box(
+        rx.vstack(
+            rx.hstack(
+                rx.box(
+                    rx.text("💧", font_size="4em", color="#60a5fa"),
+                    padding="1rem",
+                    bg="rgba(255,255,255,0.1)",
+                    border_radius="50%",
+                    border="2px solid rgba(255,255,255,0.3)",
+                ),
                 rx.vstack(
-                    rx.hstack(
-                        rx.box(
-                            rx.text("💧", font_size="4em", color="#60a5fa"),
-                            padding="1rem",
-                            bg="rgba(255,255,255,0.1)",
-                            border_radius="50%",
-                            border="2px solid rgba(255,255,255,0.3)",
-                        ),
-                        rx.vstack(
-                            rx.heading(
-                                "Asada Tsa Diglo Wak",
-                                size="6",
-                                color="white",
-                                font_weight="800",
-                            ),
-                            rx.text(
-                                "Sistema de Monitoreo y Control de Tanques",
-                                size="4",
-                                color="rgba(255,255,255,0.9)",
-                                font_style="italic",
-                            ),
-                            align_items="start",
-                        ),
-                        align_items="center",
+                    rx.heading(
+                        "Asada Tsa Diglo Wak",
+                        size="6",
+                        color="white",
+                        font_weight="800",
                     ),
                     rx.text(
-                        "🏛️ Comunidad Indígena Cabécar • 🌊 Gestión Inteligente del Agua",
-                        color="rgba(255,255,255,0.8)",
-                        font_size="1.1em",
-                        text_align="center",
+                        "Sistema de Monitoreo y Control de Tanques",
+                        size="4",
+                        color="rgba(255,255,255,0.9)",
+                        font_style="italic",
                     ),
-                    align_items="center",
+                    align_items="start",
                 ),
-                padding="2.5rem",
-                bg="rgba(0, 0, 0, 0.15)",
-                border="1px solid rgba(255,255,255,0.2)",
-                border_radius="20px",
-                margin_bottom="2rem",
-                backdrop_filter="blur(15px)",
+                align_items="center",
+            ),
+            rx.text(
+                "🏛️ Comunidad Indígena Cabécar • 🌊 Gestión Inteligente del Agua",
+                color="rgba(255,255,255,0.8)",
+                font_size="1.1em",
+                text_align="center",
             ),
+            align_items="center",
+        ),
+        padding="2.5rem",
+        bg="rgba(0, 0, 0, 0.15)",
+        border="1px solid rgba(255,255,255,0.2)",
+        border_radius="20px",
+        margin_bottom="2rem",
+        backdrop_filter="blur(15px)",
+    )
+
+
+def dashboard() -> rx.Component:
+    return rx.box(
+        rx.container(
+            dashboard_header(),
 
             rx.box(
                 rx.vstack(
@@ -191,8 +397,8 @@ def dashboard() -> rx.Component:
                         rx.text("🌐 Estado API:", font_weight="bold", color="white"),
                         rx.cond(
                             DashboardState.api_connected,
-                            rx.text("✅ Conectada", color="#4ade80", font_weight="bold"),
-                            rx.text("❌ Desconectada", color="#ef4444", font_weight="bold"),
+                            rx.text("✅ Conectada", **ON_STYLE),
+                            rx.text("❌ Desconectada", **OFF_STYLE),
                         ),
                         rx.text("⏰", color="white"),
                         rx.text(DashboardState.last_update, color="rgba(255,255,255,0.8)"),
@@ -203,7 +409,7 @@ def dashboard() -> rx.Component:
                         "🔄 Cargar Datos",
                         on_click=DashboardState.load_data,
                         loading=DashboardState.loading,
-                        bg="rgba(59, 130, 246, 0.8)",
+                        bg=BTN_BLUE,
                         color="white",
                         size="3",
                         border="1px solid rgba(255,255,255,0.2)",
@@ -226,11 +432,50 @@ def dashboard() -> rx.Component:
                 border="1px solid rgba(255,255,255,0.1)",
                 border_radius="12px",
                 margin_bottom="2rem",
-                backdrop_filter="blur(10px)",
             ),
 
-            # (tu grid y footer pueden quedarse igual; no los toqué para no romper diseño)
-            # Si querés, luego pegamos el resto exacto sin cambios.
+            rx.grid(
+                rx.vstack(
+                    rx.heading("🏗️ Tanque A - Cisterna", size="5", color="white"),
+                    rx.text("Capacidad: 50 m³", **LABEL_STYLE),
+                    rx.text(DashboardState.tank_a_nivel_text, **VALUE_STYLE, **SECTION_STYLE),
+                    rx.text(DashboardState.tank_a_altura_text, **LABEL_STYLE),
+                    rx.text(DashboardState.tank_a_volumen_text, **LABEL_STYLE),
+                    rx.cond(
+                        DashboardState.pump_status,
+                        rx.text("🟢 Bomba encendida", **ON_STYLE, **SECTION_STYLE),
+                        rx.text("🔴 Bomba apagada", **OFF_STYLE, **SECTION_STYLE),
+                    ),
+                    **CARD_STYLE,
+                ),
+                rx.vstack(
+                    rx.heading("🏛️ Tanque B - 150 m³", size="5", color="white"),
+                    rx.text("Capacidad: 150 m³", **LABEL_STYLE),
+                    rx.text(DashboardState.tank_b_nivel_text, **VALUE_STYLE, **SECTION_STYLE),
+                    rx.text(DashboardState.tank_b_altura_text, **LABEL_STYLE),
+                    rx.text(DashboardState.tank_b_volumen_text, **LABEL_STYLE),
+                    rx.text(DashboardState.chlorine_text, color="white", font_size="0.9em", **SECTION_STYLE),
+                    rx.cond(
+                        DashboardState.chlorinator_status,
+                        rx.text("🟢 Clorador encendido", **ON_STYLE),
+                        rx.text("🔴 Clorador apagado", **OFF_STYLE),
+                    ),
+                    **CARD_STYLE,
+                ),
+                rx.vstack(
+                    rx.heading("🎛️ Controles", size="5", color="white"),
+                    rx.text("Modo manual / automático", **LABEL_STYLE),
+                    rx.button("🟢 Encender Bomba", on_click=DashboardState.control("pump_on"), bg=BTN_GREEN, **BTN_STYLE),
+                    rx.button("🔴 Apagar Bomba", on_click=DashboardState.control("pump_off"), bg=BTN_RED, **BTN_STYLE),
+                    rx.button("🟢 Encender Clorador", on_click=DashboardState.control("chlorinator_on"), bg=BTN_GREEN, **BTN_STYLE),
+                    rx.button("🔴 Apagar Clorador", on_click=DashboardState.control("chlorinator_off"), bg=BTN_RED, **BTN_STYLE),
+                    rx.button("🤖 Modo Automático", on_click=DashboardState.control("auto_mode"), bg=BTN_BLUE, **BTN_STYLE, margin_top="1rem"),
+                    **CARD_STYLE,
+                ),
+                columns="3",
+                spacing="4",
+                width="100%",
+            ),
 
             padding="2rem",
             max_width="1400px",
@@ -243,5 +488,11 @@ def dashboard() -> rx.Component:
 
 
 app = rx.App()
-app.add_page(dashboard, route="/", title="Asada Tsa Diglo Wak")
+app.register_lifespan_task(api_client_lifespan)
+app.add_page(
+    dashboard,
+    route="/",
+    title="Asada Tsa Diglo Wak",
+    on_load=[DashboardState.load_data, DashboardState.subscribe_updates],
+)
 
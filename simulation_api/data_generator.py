@@ -3,12 +3,12 @@ Generador de datos de sensores para el sistema ASADAS Tsa Diglo
 Simula lecturas de tanques de agua con bomba y cloración
 """
 
-import random
 import time
+import numpy as np
 from datetime import datetime, timedelta
 from enum import Enum
-from dataclasses import dataclass
-from typing import Dict, List, Any, Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Tuple
 
 
 class TankType(Enum):
@@ -16,7 +16,7 @@ class TankType(Enum):
     TANK_B = "tank_b"  # Tanque 150m³
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class TankConfig:
     tank_id: str
     name: str
@@ -26,10 +26,33 @@ class TankConfig:
     has_chlorine_sensor: bool
     normal_consumption_rate: float  # m³/hour
 
+    # Derivados (se calculan una vez al crear la config)
+    cm_per_m3: float = field(init=False)  # cm de nivel por m³ de agua
+    percent_per_cm: float = field(init=False)  # % de llenado por cm de nivel
+    pump_on_cm: float = field(init=False)  # nivel (85%) que enciende la bomba automática
+    pump_off_cm: float = field(init=False)  # nivel (60%) que la apaga
 
-# Configuraciones de tanques
-TANK_CONFIGS = {
-    TankType.TANK_A: TankConfig(
+    def __post_init__(self):
+        # frozen: los derivados se asignan por object.__setattr__
+        object.__setattr__(self, "cm_per_m3", self.max_height_cm / self.capacity_m3)
+        object.__setattr__(self, "percent_per_cm", 100 / self.max_height_cm)
+        object.__setattr__(self, "pump_on_cm", self.max_height_cm * 0.85)
+        object.__setattr__(self, "pump_off_cm", self.max_height_cm * 0.60)
+
+
+# Umbrales de cloro (ppm): rango aceptable y rango óptimo (donde actúa el clorador automático)
+CHLORINE_MIN_PPM = 0.5
+CHLORINE_OPTIMAL_LOW_PPM = 0.8
+CHLORINE_OPTIMAL_HIGH_PPM = 1.5
+CHLORINE_MAX_PPM = 2.0
+
+# chlorine_status fuera de rango -> status de alerta de la lectura
+CHLORINE_ALERT_STATUS = {"low": "low_chlorine", "high": "high_chlorine"}
+
+
+# Configuraciones de tanques (claves: tank_id en string, sin pasar por el Enum en el hot path)
+TANK_CONFIGS: Dict[str, TankConfig] = {
+    "tank_a": TankConfig(
         tank_id="tank_a",
         name="Cisterna",
         capacity_m3=50.0,
@@ -38,7 +61,7 @@ TANK_CONFIGS = {
         has_chlorine_sensor=False,
         normal_consumption_rate=0.0  # No se consume, solo se llena
     ),
-    TankType.TANK_B: TankConfig(
+    "tank_b": TankConfig(
         tank_id="tank_b",
         name="Tanque 150",
         capacity_m3=150.0,
@@ -50,233 +73,313 @@ TANK_CONFIGS = {
 }
 
 
+# Patrones de consumo por hora del día (índice = hora 0..23)
+CONSUMPTION_BY_HOUR = (
+    0.5, 0.3, 0.2, 0.2, 0.3, 0.8,
+    1.5, 2.0, 1.8, 1.2, 1.0, 1.3,
+    1.8, 1.5, 1.2, 1.0, 1.2, 1.8,
+    2.2, 2.5, 2.0, 1.5, 1.2, 0.8,
+)
+
+# Ruido de la física por tick:
+# (entrada a la cisterna m³/h, variación del consumo del tanque B m³/h)
+TICK_NOISE_LOW = np.array([3.0, -0.5])
+TICK_NOISE_HIGH = np.array([8.0, 0.5])
+
+# Ruido de medición por lectura:
+# (nivel cm, temperatura °C, entrada estimada m³/h, cloro ppm, pH)
+READING_NOISE_LOW = np.array([-0.5, -0.3, 3.0, -0.05, -0.1])
+READING_NOISE_HIGH = np.array([0.5, 0.3, 8.0, 0.05, 0.1])
+
+# Filas de ruido pre-generadas por cada llamada a NumPy
+NOISE_BLOCK_SIZE = 4096
+
+
+class NoiseBlock:
+    """Filas de ruido uniforme generadas por bloques; al agotarse se genera uno nuevo (sin repetir)"""
+
+    __slots__ = ("_rng", "_low", "_high", "_rows", "_i")
+
+    def __init__(self, rng: np.random.Generator, low: np.ndarray, high: np.ndarray):
+        self._rng = rng
+        self._low = low
+        self._high = high
+        # Primer bloque al construir: la primera lectura no paga el sorteo
+        self._refill()
+
+    def _refill(self) -> None:
+        self._rows: List[List[float]] = self._rng.uniform(
+            self._low, self._high, size=(NOISE_BLOCK_SIZE, len(self._low))
+        ).tolist()
+        self._i = 0
+
+    def next(self) -> List[float]:
+        if self._i >= NOISE_BLOCK_SIZE:
+            self._refill()
+
+        row = self._rows[self._i]
+        self._i += 1
+        return row
+
+
+def simulate_step(
+    level_a: float,
+    level_b: float,
+    chlorine: float,
+    pump_running: bool,
+    chlorinator_running: bool,
+    inflow_rate: float,
+    consumption_rate: float,
+    min_h_a: float, max_h_a: float, cm_per_m3_a: float,
+    min_h_b: float, max_h_b: float, cm_per_m3_b: float,
+) -> Tuple[float, float, float, float]:
+    """
+    Un minuto de simulación física, solo con floats (sin dicts ni datetime)
+    Devuelve (nivel A cm, nivel B cm, cloro ppm, caudal de la bomba m³/h)
+    """
+    # ============= TANQUE A (CISTERNA) =============
+    # Si la bomba está funcionando, bombear agua al tanque B
+    outflow_rate = 12.0 if pump_running else 0.0  # m³/hour bomba
+
+    net_change_m3 = (inflow_rate - outflow_rate) / 60  # Por minuto
+    new_level_a = max(min_h_a, min(max_h_a, level_a + net_change_m3 * cm_per_m3_a))
+
+    # ============= TANQUE B (TANQUE 150) =============
+    # Entrada desde la bomba del tanque A, consumo variable según hora del día
+    net_change_b_m3 = (outflow_rate - consumption_rate) / 60  # Por minuto
+    new_level_b = max(min_h_b, min(max_h_b, level_b + net_change_b_m3 * cm_per_m3_b))
+
+    # ============= SISTEMA DE CLORACIÓN =============
+    chlorine_addition = 0.15 if chlorinator_running else 0.0  # ppm/hora cuando está activo
+    chlorine_degradation = 0.05  # ppm/hora degradación natural
+
+    # Dilución por agua nueva
+    dilution_factor = 1.0
+    if outflow_rate > 0:
+        dilution_factor = 1 - (outflow_rate * cm_per_m3_b / new_level_b)
+
+    net_chlorine_change = ((chlorine_addition - chlorine_degradation) * dilution_factor) / 60
+    new_chlorine = max(0.0, min(3.0, chlorine + net_chlorine_change))
+
+    return new_level_a, new_level_b, new_chlorine, outflow_rate
+
+
+def level_status(level_percent: float) -> str:
+    """Estado de alerta por nivel de agua"""
+    if level_percent < 20:
+        return "low_water"
+    if level_percent > 90:
+        return "high_water"
+    return "normal"
+
+
 class SensorDataGenerator:
     def __init__(self):
-        self.start_time = datetime.now()
+        self.start_time = now = datetime.now()
+        self._rng = np.random.default_rng()
+        self._tick_noise = NoiseBlock(self._rng, TICK_NOISE_LOW, TICK_NOISE_HIGH)
+        self._reading_noise = NoiseBlock(self._rng, READING_NOISE_LOW, READING_NOISE_HIGH)
 
         # Estados iniciales de los tanques
         self.tank_states = {
-            TankType.TANK_A: {
+            "tank_a": {
                 "water_level_cm": 120.0,  # Nivel inicial cisterna
                 "pump_running": False,
-                "last_pump_change": datetime.now(),
+                "last_pump_change": now,
                 "temperature": 24.0,
                 "flow_rate": 0.0
             },
-            TankType.TANK_B: {
+            "tank_b": {
                 "water_level_cm": 200.0,  # Nivel inicial tanque 150
                 "chlorine_ppm": 1.2,
                 "chlorinator_running": False,
-                "last_chlorinator_change": datetime.now(),
+                "last_chlorinator_change": now,
                 "temperature": 23.0,
                 "flow_rate": 0.0,
                 "ph": 7.2
             }
         }
 
-        # Patrones de consumo por hora del día
-        self.consumption_patterns = {
-            0: 0.5, 1: 0.3, 2: 0.2, 3: 0.2, 4: 0.3, 5: 0.8,
-            6: 1.5, 7: 2.0, 8: 1.8, 9: 1.2, 10: 1.0, 11: 1.3,
-            12: 1.8, 13: 1.5, 14: 1.2, 15: 1.0, 16: 1.2, 17: 1.8,
-            18: 2.2, 19: 2.5, 20: 2.0, 21: 1.5, 22: 1.2, 23: 0.8
-        }
-
-    def update_tank_levels(self):
-        """Actualizar niveles de agua según lógica del sistema"""
-        current_hour = datetime.now().hour
-        consumption_multiplier = self.consumption_patterns.get(current_hour, 1.0)
-
-        # ============= TANQUE A (CISTERNA) =============
-        tank_a_state = self.tank_states[TankType.TANK_A]
-        config_a = TANK_CONFIGS[TankType.TANK_A]
-
-        # Lógica automática de bomba si no está en modo manual
-        current_level_a = tank_a_state["water_level_cm"]
-        current_percent_a = (current_level_a / config_a.max_height_cm) * 100
-
+        # Control manual activo: la lógica automática no toca el equipo
+        self.pump_manual_override: bool = False
+        self.chlorinator_manual_override: bool = False
+
+    def update_tank_levels(self, now: Optional[datetime] = None):
+        """Actualizar niveles de agua según lógica del sistema (un solo reloj por tick)"""
+        if now is None:
+            now = datetime.now()
+        consumption_multiplier = CONSUMPTION_BY_HOUR[now.hour]
+
+        tank_a_state = self.tank_states["tank_a"]
+        tank_b_state = self.tank_states["tank_b"]
+        config_a = TANK_CONFIGS["tank_a"]
+        config_b = TANK_CONFIGS["tank_b"]
+
+        # Estado del tick en locales: se lee una vez y se escribe una vez al final
+        level_a = tank_a_state["water_level_cm"]
+        level_b = tank_b_state["water_level_cm"]
+        chlorine = tank_b_state["chlorine_ppm"]
+        pump_running = tank_a_state["pump_running"]
+        chlorinator_running = tank_b_state["chlorinator_running"]
+
+        # ============= LÓGICA AUTOMÁTICA (si no está en modo manual) =============
         # La bomba se enciende automáticamente cuando la cisterna está llena (≥85%)
         # y se apaga cuando baja a ≤60%
-        if not hasattr(self, 'pump_manual_override'):
-            if current_percent_a >= 85 and not tank_a_state["pump_running"]:
-                tank_a_state["pump_running"] = True
-                tank_a_state["last_pump_change"] = datetime.now()
-            elif current_percent_a <= 60 and tank_a_state["pump_running"]:
-                tank_a_state["pump_running"] = False
-                tank_a_state["last_pump_change"] = datetime.now()
-
-        # Simular entrada de agua a la cisterna (captaciones)
-        inflow_rate = random.uniform(3.0, 8.0)  # m³/hour entrada variable
-
-        # Si la bomba está funcionando, bombear agua al tanque B
-        outflow_rate = 12.0 if tank_a_state["pump_running"] else 0.0  # m³/hour bomba
-
-        # Cambio neto en la cisterna
-        net_change_m3 = (inflow_rate - outflow_rate) / 60  # Por minuto
-        level_change_cm = (net_change_m3 / (config_a.capacity_m3 / config_a.max_height_cm))
-
-        new_level_a = max(config_a.min_height_cm,
-                         min(config_a.max_height_cm,
-                             tank_a_state["water_level_cm"] + level_change_cm))
-
-        tank_a_state["water_level_cm"] = new_level_a
-        tank_a_state["flow_rate"] = outflow_rate if tank_a_state["pump_running"] else 0.0
-
-        # ============= TANQUE B (TANQUE 150) =============
-        tank_b_state = self.tank_states[TankType.TANK_B]
-        config_b = TANK_CONFIGS[TankType.TANK_B]
-
-        # Entrada desde la bomba del tanque A
-        inflow_b = outflow_rate if tank_a_state["pump_running"] else 0.0
-
-        # Consumo variable según hora del día
-        consumption_rate = config_b.normal_consumption_rate * consumption_multiplier
-        consumption_rate += random.uniform(-0.5, 0.5)  # Variación aleatoria
-
-        # Cambio neto en tanque B
-        net_change_b_m3 = (inflow_b - consumption_rate) / 60  # Por minuto
-        level_change_b_cm = (net_change_b_m3 / (config_b.capacity_m3 / config_b.max_height_cm))
-
-        new_level_b = max(config_b.min_height_cm,
-                         min(config_b.max_height_cm,
-                             tank_b_state["water_level_cm"] + level_change_b_cm))
-
-        tank_b_state["water_level_cm"] = new_level_b
+        if not self.pump_manual_override:
+            if level_a >= config_a.pump_on_cm and not pump_running:
+                pump_running = tank_a_state["pump_running"] = True
+                tank_a_state["last_pump_change"] = now
+            elif level_a <= config_a.pump_off_cm and pump_running:
+                pump_running = tank_a_state["pump_running"] = False
+                tank_a_state["last_pump_change"] = now
+
+        # El clorador se enciende bajo el rango óptimo y se apaga sobre él
+        if not self.chlorinator_manual_override:
+            if chlorine < CHLORINE_OPTIMAL_LOW_PPM and not chlorinator_running:
+                chlorinator_running = tank_b_state["chlorinator_running"] = True
+                tank_b_state["last_chlorinator_change"] = now
+            elif chlorine > CHLORINE_OPTIMAL_HIGH_PPM and chlorinator_running:
+                chlorinator_running = tank_b_state["chlorinator_running"] = False
+                tank_b_state["last_chlorinator_change"] = now
+
+        # ============= FÍSICA DEL TICK =============
+        # Simular entrada de agua a la cisterna (captaciones) y variación del consumo
+        inflow_rate, consumption_noise = self._tick_noise.next()
+        consumption_rate = config_b.normal_consumption_rate * consumption_multiplier + consumption_noise
+
+        level_a, level_b, chlorine, outflow_rate = simulate_step(
+            level_a,
+            level_b,
+            chlorine,
+            pump_running,
+            chlorinator_running,
+            inflow_rate,
+            consumption_rate,
+            config_a.min_height_cm, config_a.max_height_cm, config_a.cm_per_m3,
+            config_b.min_height_cm, config_b.max_height_cm, config_b.cm_per_m3,
+        )
+
+        tank_a_state["water_level_cm"] = level_a
+        tank_a_state["flow_rate"] = outflow_rate
+        tank_b_state["water_level_cm"] = level_b
         tank_b_state["flow_rate"] = consumption_rate
+        tank_b_state["chlorine_ppm"] = chlorine
 
-        # ============= SISTEMA DE CLORACIÓN =============
-        current_chlorine = tank_b_state["chlorine_ppm"]
-
-        # Lógica automática del clorador
-        if not hasattr(self, 'chlorinator_manual_override'):
-            if current_chlorine < 0.8 and not tank_b_state["chlorinator_running"]:
-                tank_b_state["chlorinator_running"] = True
-                tank_b_state["last_chlorinator_change"] = datetime.now()
-            elif current_chlorine > 1.5 and tank_b_state["chlorinator_running"]:
-                tank_b_state["chlorinator_running"] = False
-                tank_b_state["last_chlorinator_change"] = datetime.now()
-
-        # Cambio en niveles de cloro
-        if tank_b_state["chlorinator_running"]:
-            chlorine_addition = 0.15  # ppm/hora cuando está activo
-        else:
-            chlorine_addition = 0.0
+    def get_tank_reading(self, tank_type: TankType, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Generar lectura completa de un tanque específico"""
+        return self.build_reading(tank_type.value, now)
 
-        # Degradación natural del cloro
-        chlorine_degradation = 0.05  # ppm/hora degradación natural
+    def build_reading(self, tank_id: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Generar la lectura de un tanque por tank_id (sin pasar por el Enum)"""
+        return READING_BUILDERS[tank_id](self, TANK_CONFIGS[tank_id], self.tank_states[tank_id], now or datetime.now())
 
-        # Dilución por agua nueva
-        dilution_factor = 1.0
-        if inflow_b > 0:
-            dilution_factor = 1 - (inflow_b / (config_b.capacity_m3 * (new_level_b / config_b.max_height_cm)))
+    def _build_tank_a_reading(self, config: TankConfig, state: Dict[str, Any], timestamp: datetime) -> Dict[str, Any]:
+        """Lectura de la cisterna (bomba + entrada estimada)"""
+        # Calcular métricas básicas
+        current_level = state["water_level_cm"]
+        level_percent = current_level * config.percent_per_cm
 
-        net_chlorine_change = ((chlorine_addition - chlorine_degradation) * dilution_factor) / 60
-        new_chlorine = max(0.0, min(3.0, current_chlorine + net_chlorine_change))
-        tank_b_state["chlorine_ppm"] = new_chlorine
+        # Agregar ruido realista a las mediciones
+        # (sin redondeo: el formato de presentación lo decide cada cliente)
+        level_noise, temp_noise, inflow_estimated, _, _ = self._reading_noise.next()
 
-    def get_tank_reading(self, tank_type: TankType) -> Dict[str, Any]:
-        """Generar lectura completa de un tanque específico"""
-        config = TANK_CONFIGS[tank_type]
-        state = self.tank_states[tank_type]
+        return {
+            "tank_id": config.tank_id,
+            "tank_name": config.name,
+            "timestamp": timestamp,
+            "water_level_cm": current_level + level_noise,
+            "water_level_percent": level_percent,
+            "water_volume_m3": current_level / config.cm_per_m3,
+            "temperature": state["temperature"] + temp_noise,
+            "capacity_m3": config.capacity_m3,
+            "max_height_cm": config.max_height_cm,
+            "status": level_status(level_percent),
+            "pump_status": state["pump_running"],
+            "pump_last_change": state["last_pump_change"],
+            "flow_rate_m3h": state["flow_rate"],
+            "inflow_estimated": inflow_estimated,
+        }
 
+    def _build_tank_b_reading(self, config: TankConfig, state: Dict[str, Any], timestamp: datetime) -> Dict[str, Any]:
+        """Lectura del tanque 150 (cloro, pH y consumo)"""
         # Calcular métricas básicas
         current_level = state["water_level_cm"]
-        level_percent = (current_level / config.max_height_cm) * 100
-        volume_m3 = config.capacity_m3 * (current_level / config.max_height_cm)
+        level_percent = current_level * config.percent_per_cm
 
         # Agregar ruido realista a las mediciones
-        level_noise = random.uniform(-0.5, 0.5)
-        temp_noise = random.uniform(-0.3, 0.3)
+        # (sin redondeo: el formato de presentación lo decide cada cliente)
+        level_noise, temp_noise, _, chlorine_noise, ph_noise = self._reading_noise.next()
+
+        # Estado del cloro según niveles (inline: se evalúa en cada lectura del tanque B)
+        chlorine = state["chlorine_ppm"]
+        if chlorine < CHLORINE_MIN_PPM:
+            chlorine_status = "low"
+        elif chlorine > CHLORINE_MAX_PPM:
+            chlorine_status = "high"
+        elif CHLORINE_OPTIMAL_LOW_PPM <= chlorine <= CHLORINE_OPTIMAL_HIGH_PPM:
+            chlorine_status = "optimal"
+        else:
+            chlorine_status = "normal"
+
+        status = level_status(level_percent)
+        if status == "normal":
+            status = CHLORINE_ALERT_STATUS.get(chlorine_status, "normal")
 
-        reading = {
+        return {
             "tank_id": config.tank_id,
             "tank_name": config.name,
-            "timestamp": datetime.now(),
-            "water_level_cm": round(current_level + level_noise, 2),
-            "water_level_percent": round(level_percent, 1),
-            "water_volume_m3": round(volume_m3, 2),
-            "temperature": round(state["temperature"] + temp_noise, 1),
+            "timestamp": timestamp,
+            "water_level_cm": current_level + level_noise,
+            "water_level_percent": level_percent,
+            "water_volume_m3": current_level / config.cm_per_m3,
+            "temperature": state["temperature"] + temp_noise,
             "capacity_m3": config.capacity_m3,
             "max_height_cm": config.max_height_cm,
-            "status": "normal"
+            "status": status,
+            "chlorine_ppm": chlorine + chlorine_noise,
+            "chlorine_status": chlorine_status,
+            "chlorinator_status": state["chlorinator_running"],
+            "chlorinator_last_change": state["last_chlorinator_change"],
+            "consumption_rate_m3h": state["flow_rate"],
+            "ph": state["ph"] + ph_noise,
         }
 
-        # Datos específicos por tipo de tanque
-        if tank_type == TankType.TANK_A:
-            reading.update({
-                "pump_status": state["pump_running"],
-                "pump_last_change": state["last_pump_change"],
-                "flow_rate_m3h": round(state["flow_rate"], 2),
-                "inflow_estimated": round(random.uniform(3.0, 8.0), 2)
-            })
-
-        elif tank_type == TankType.TANK_B:
-            chlorine_noise = random.uniform(-0.05, 0.05)
-            reading.update({
-                "chlorine_ppm": round(state["chlorine_ppm"] + chlorine_noise, 3),
-                "chlorine_status": self._get_chlorine_status(state["chlorine_ppm"]),
-                "chlorinator_status": state["chlorinator_running"],
-                "chlorinator_last_change": state["last_chlorinator_change"],
-                "consumption_rate_m3h": round(state["flow_rate"], 2),
-                "ph": round(state["ph"] + random.uniform(-0.1, 0.1), 2)
-            })
-
-        # Estados de alerta
-        if level_percent < 20:
-            reading["status"] = "low_water"
-        elif level_percent > 90:
-            reading["status"] = "high_water"
-        elif tank_type == TankType.TANK_B and state["chlorine_ppm"] < 0.5:
-            reading["status"] = "low_chlorine"
-        elif tank_type == TankType.TANK_B and state["chlorine_ppm"] > 2.0:
-            reading["status"] = "high_chlorine"
-
-        return reading
-
-    def _get_chlorine_status(self, chlorine_ppm: float) -> str:
-        """Determinar estado del cloro según niveles"""
-        if chlorine_ppm < 0.5:
-            return "low"
-        elif chlorine_ppm > 2.0:
-            return "high"
-        elif 0.8 <= chlorine_ppm <= 1.5:
-            return "optimal"
-        else:
-            return "normal"
+    def build_readings(self, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Lecturas de todos los tanques en una pasada, con un mismo timestamp"""
+        if now is None:
+            now = datetime.now()
+        return [self.build_reading(tank_id, now) for tank_id in TANK_CONFIGS]
+
 
+# Constructor de lectura por tank_id: una búsqueda en dict en lugar de comparar strings
+READING_BUILDERS = {
+    "tank_a": SensorDataGenerator._build_tank_a_reading,
+    "tank_b": SensorDataGenerator._build_tank_b_reading,
+}
 
 # Instancia global del generador
 sensor_generator = SensorDataGenerator()
 
 
-def get_latest_readings() -> List[Dict[str, Any]]:
+def get_latest_readings(now: Optional[datetime] = None) -> List[Dict[str, Any]]:
     """Obtener lecturas actuales de todos los tanques"""
     # Actualizar estados antes de generar lecturas
-    sensor_generator.update_tank_levels()
-
-    readings = []
-    for tank_type in TankType:
-        reading = sensor_generator.get_tank_reading(tank_type)
-        readings.append(reading)
-
-    return readings
+    if now is None:
+        now = datetime.now()
+    sensor_generator.update_tank_levels(now)
+    return sensor_generator.build_readings(now)
 
 
 def get_tank_reading(tank_id: str) -> Dict[str, Any]:
     """Obtener lectura de un tanque específico"""
-    # Mapear tank_id a TankType
-    tank_type = None
-    if tank_id == "tank_a":
-        tank_type = TankType.TANK_A
-    elif tank_id == "tank_b":
-        tank_type = TankType.TANK_B
-    else:
+    if tank_id not in TANK_CONFIGS:
         raise ValueError(f"tank_id inválido: {tank_id}")
 
     # Actualizar estados
-    sensor_generator.update_tank_levels()
+    now = datetime.now()
+    sensor_generator.update_tank_levels(now)
 
-    return sensor_generator.get_tank_reading(tank_type)
+    return sensor_generator.build_reading(tank_id, now)
 
 
 # Función de prueba
@@ -0,0 +1,10 @@
+"""
+Configuración común de los tests: base SQLite temporal (nunca la de desarrollo ni DATABASE_URL real)
+"""
+
+import os
+import tempfile
+
+# Antes de importar utils.db / main: el engine se crea al importar el módulo
+_DB_DIR = tempfile.mkdtemp(prefix="asadas-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_DIR}/asadas_test.db"
@@ -0,0 +1,255 @@
+"""
+Tests de los endpoints de la API con TestClient (lifespan completo sobre la base temporal)
+"""
+
+import asyncio
+import time
+
+import orjson
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("fastapi_cache")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_controls(monkeypatch):
+    """Controles en automático en cada test (y overrides del generador restaurados al terminar)"""
+    monkeypatch.setattr(main, "manual_controls", main.ManualControls())
+    monkeypatch.setattr(main.sensor_generator, "pump_manual_override", False)
+    monkeypatch.setattr(main.sensor_generator, "chlorinator_manual_override", False)
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+# =================== CACHE DE RESPUESTAS ===================
+
+@pytest.mark.parametrize("path", ["/api/history?hours=2", "/api/history?hours=2&format=columnar"])
+def test_cached_hit_is_byte_identical_to_miss(client, path):
+    first = client.get(path)
+    second = client.get(path)
+
+    assert first.status_code == second.status_code == 200
+    assert second.headers["x-fastapi-cache"] == "HIT"
+    assert second.content == first.content
+    # Los datetime naive siguen naive (sin "+00:00" agregado por el cache)
+    assert b"+00:00" not in second.content
+
+
+@pytest.mark.parametrize("path", ["/api/status", "/api/dashboard", "/api/config"])
+def test_precomputed_endpoints_are_not_cached(client, path):
+    first = client.get(path)
+    time.sleep(0.01)
+    second = client.get(path)
+
+    assert "x-fastapi-cache" not in second.headers
+    # El timestamp es el de cada request, no el de una respuesta guardada
+    assert second.json()["timestamp"] > first.json()["timestamp"]
+
+
+# =================== TICKS DE SIMULACIÓN ===================
+
+@pytest.fixture
+def simulation_ticks(monkeypatch):
+    """Contar cada avance de la simulación (get_latest_readings) a partir del arranque"""
+    ticks = []
+    real_get_latest_readings = main.get_latest_readings
+
+    def counting_get_latest_readings(now):
+        ticks.append(now)
+        return real_get_latest_readings(now)
+
+    monkeypatch.setattr(main, "get_latest_readings", counting_get_latest_readings)
+    return ticks
+
+
+def test_startup_advances_simulation_once(simulation_ticks):
+    with TestClient(main.app) as test_client:
+        test_client.get("/health")
+        time.sleep(0.1)  # Darle turno al actualizador en el loop del TestClient
+
+    assert len(simulation_ticks) == 1
+
+
+@pytest.mark.parametrize("run", [1, 2])
+def test_updater_keeps_ticking_in_every_lifespan(simulation_ticks, monkeypatch, run):
+    """Cada TestClient corre en su propio event loop: el actualizador debe seguir vivo en todos"""
+    monkeypatch.setattr(main, "READINGS_HEARTBEAT_SECONDS", 0.05)
+
+    with TestClient(main.app) as test_client:
+        time.sleep(0.3)
+        test_client.get("/health")
+
+    # El refresco del lifespan más varios ticks del heartbeat
+    assert len(simulation_ticks) >= 3
+
+
+def test_updater_errors_are_rate_limited(monkeypatch):
+    """Con reintentos cada 10 ms y logs cada 60 s, una racha de errores deja un solo log"""
+    # Con un intervalo igual al reintento cada error llegaría ya vencido y se loguearía
+    assert main.CACHE_ERROR_LOG_INTERVAL >= 10 * main.CACHE_ERROR_RETRY_SECONDS
+
+    logged = []
+    monkeypatch.setattr(main, "READINGS_HEARTBEAT_SECONDS", 0.0)
+    monkeypatch.setattr(main, "CACHE_ERROR_RETRY_SECONDS", 0.01)
+    monkeypatch.setattr(main.logger, "exception", lambda *args: logged.append(args))
+
+    def failing_refresh():
+        raise RuntimeError("fallo de prueba")
+
+    monkeypatch.setattr(main, "refresh_readings_cache", failing_refresh)
+
+    async def run_updater():
+        monkeypatch.setattr(main, "readings_event", asyncio.Event())
+        task = asyncio.create_task(main.update_readings_cache())
+        await asyncio.sleep(0.2)
+        task.cancel()
+
+    asyncio.run(run_updater())
+
+    assert len(logged) == 1
+
+
+def test_control_click_does_not_tick_simulation(simulation_ticks):
+    with TestClient(main.app) as test_client:
+        pending_before = len(main.pending_readings)
+
+        response = test_client.post("/api/control/pump/on")
+        time.sleep(0.1)
+        test_client.get("/health")
+
+        assert response.status_code == 200
+        assert len(simulation_ticks) == 1
+        assert len(main.pending_readings) == pending_before
+        # El snapshot del click queda como lectura vigente de /api/readings
+        tank_a = test_client.get("/api/readings").json()["readings"][0]
+        assert tank_a["pump_status"] is True
+
+
+# =================== LECTURAS ===================
+
+def test_readings_default_rows(client):
+    response = client.get("/api/readings")
+    data = response.json()
+
+    # Bytes serializados una vez por refresco: mismo contenido que el payload precalculado
+    assert response.content == main.latest_readings_blob
+    assert data["success"] is True and data["format"] == "rows"
+    assert [r["tank_id"] for r in data["readings"]] == ["tank_a", "tank_b"]
+    assert data["control_modes"] == {"pump_mode": "automatic", "chlorinator_mode": "automatic"}
+
+
+def test_readings_columnar(client):
+    data = client.get("/api/readings", params={"format": "columnar"}).json()
+
+    assert data["format"] == "columnar"
+    assert data["readings"]["tank_id"] == ["tank_a", "tank_b"]
+    assert len(data["readings"]["water_level_cm"]) == data["tanks_count"] == 2
+
+
+def test_readings_rejects_unknown_format(client):
+    assert client.get("/api/readings", params={"format": "xml"}).status_code == 400
+
+
+def test_readings_field_projection(client):
+    data = client.get("/api/readings", params={"fields": "tank_id,pump_status"}).json()
+    # Cada lectura trae solo los campos pedidos que tiene (el tanque B no tiene bomba)
+    assert [set(r) for r in data["readings"]] == [{"tank_id", "pump_status"}, {"tank_id"}]
+
+    columns = client.get("/api/readings", params={"format": "columnar", "fields": "tank_id"}).json()
+    assert columns["readings"] == {"tank_id": ["tank_a", "tank_b"]}
+
+
+def test_tank_endpoint(client):
+    data = client.get("/api/tank/tank_b").json()
+
+    assert data["success"] is True
+    assert data["tank"]["tank_id"] == "tank_b"
+    assert "chlorine_ppm" in data["tank"]
+
+
+# =================== VALIDACIÓN (400) ===================
+
+@pytest.mark.parametrize("path", ["/api/tank/tank_x", "/api/history?hours=0", "/api/history?hours=169"])
+def test_invalid_parameters_return_400(client, path):
+    response = client.get(path)
+
+    assert response.status_code == 400
+    assert response.json()["detail"]
+
+
+# =================== CONTROLES ===================
+
+def test_pump_manual_on_and_off(client):
+    on = client.post("/api/control/pump/on").json()
+    assert on["success"] is True and on["pump_status"] == "ON" and on["mode"] == "MANUAL"
+    assert on["readings"][0]["pump_status"] is True
+
+    status = client.get("/api/control/status").json()
+    assert status["modes"]["pump"] == "MANUAL"
+    assert status["current_states"]["pump_running"] is True
+    assert status["last_actions"]["pump"]["action"] == "turn_on"
+
+    off = client.post("/api/control/pump/off").json()
+    assert off["readings"][0]["pump_status"] is False
+    assert main.sensor_generator.pump_manual_override is True
+
+
+@pytest.mark.parametrize("path", ["/api/control/pump/maybe", "/api/control/valve/on"])
+def test_device_route_rejects_unknown_values(client, path):
+    assert client.post(path).status_code == 400
+
+
+def test_control_action_body_and_auto_mode(client):
+    data = client.post("/api/control", json={"action": "chlorinator_on"}).json()
+    assert data["chlorinator_status"] == "ON"
+    assert data["readings"][1]["chlorinator_status"] is True
+    assert main.sensor_generator.chlorinator_manual_override is True
+
+    auto = client.post("/api/control", json={"action": "auto_mode"}).json()
+    assert auto["pump_mode"] == auto["chlorinator_mode"] == "AUTOMATIC"
+    assert main.sensor_generator.pump_manual_override is False
+    assert main.sensor_generator.chlorinator_manual_override is False
+    assert client.get("/api/control/status").json()["modes"] == {"pump": "AUTOMATIC", "chlorinator": "AUTOMATIC"}
+
+
+@pytest.mark.parametrize("body", [{"action": "pump_explode"}, {}, None])
+def test_control_rejects_invalid_action(client, body):
+    response = client.post("/api/control", json=body)
+
+    assert response.status_code == 400
+    assert response.json()["detail"]
+
+
+def test_dashboard_reflects_control_change(client):
+    assert client.get("/api/dashboard").json()["control"]["modes"]["pump"] == "AUTOMATIC"
+
+    client.post("/api/control/pump/on")
+    after = client.get("/api/dashboard").json()
+
+    assert after["control"]["modes"]["pump"] == "MANUAL"
+    assert after["readings"][0]["pump_status"] is True
+
+
+# =================== EVENTOS (SSE) ===================
+
+def test_control_publishes_sse_event(client):
+    subscriber = asyncio.Queue(maxsize=10)
+    main.event_subscribers.add(subscriber)
+    try:
+        client.post("/api/control/chlorinator/on")
+    finally:
+        main.event_subscribers.discard(subscriber)
+
+    message = subscriber.get_nowait()
+    assert message.startswith(b"data: ") and message.endswith(b"\n\n")
+    readings = orjson.loads(message[6:])["readings"]
+    assert readings[1]["chlorinator_status"] is True
@@ -0,0 +1,54 @@
+"""
+Tests del cierre de los pools de utils.api_client
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from utils import api_client  # noqa: E402
+
+# Puerto sin servidor: la petición falla rápido, pero el AsyncClient ya quedó creado
+UNREACHABLE_URL = "http://127.0.0.1:9"
+
+
+def test_aclose_closes_lazy_async_client():
+    client = api_client.SensorAPIClient(UNREACHABLE_URL)
+
+    async def scenario():
+        result = await client._make_request("GET", "/health")
+        async_client = client._async
+        await client.aclose()
+        return result, async_client
+
+    result, async_client = asyncio.run(scenario())
+
+    assert result["success"] is False
+    assert async_client is not None and async_client.is_closed
+    assert client._async is None
+    assert client._sync.is_closed
+
+
+def test_aclose_without_async_client():
+    client = api_client.SensorAPIClient(UNREACHABLE_URL)
+
+    asyncio.run(client.aclose())
+
+    assert client._sync.is_closed
+
+
+def test_lifespan_closes_global_client(monkeypatch):
+    client = api_client.SensorAPIClient(UNREACHABLE_URL)
+    monkeypatch.setattr(api_client, "api_client", client)
+
+    async def scenario():
+        async with api_client.api_client_lifespan():
+            await client._make_request("GET", "/health")
+            assert not client._async.is_closed
+
+    asyncio.run(scenario())
+
+    assert client._async is None
+    assert client._sync.is_closed
@@ -0,0 +1,39 @@
+"""
+Smoke test del dashboard: el módulo de Reflex debe importar sin errores
+(estilos, estado y layout se construyen al importar)
+"""
+
+import importlib
+
+import pytest
+
+pytest.importorskip("reflex")
+
+
+def test_dashboard_module_imports():
+    module = importlib.import_module("sandro_uva_proyecto_final.sandro_uva_proyecto_final")
+
+    assert module.app is not None
+    assert module.LABEL_STYLE == {"color": "rgba(255,255,255,0.8)", "font_size": "0.9em"}
+    assert module.ON_STYLE["color"] == "#4ade80"
+    assert module.OFF_STYLE["color"] == "#ef4444"
+
+
+def test_session_connected_follows_socket_tokens(monkeypatch):
+    module = importlib.import_module("sandro_uva_proyecto_final.sandro_uva_proyecto_final")
+    namespace = type("FakeNamespace", (), {"token_to_sid": {"tab-1": "sid-1"}})()
+    monkeypatch.setattr(module.app, "_event_namespace", namespace)
+
+    assert module.session_connected("tab-1")
+    assert not module.session_connected("tab-2")
+
+    # Reflex borra el token en on_disconnect: el loop SSE de esa pestaña debe terminar
+    del namespace.token_to_sid["tab-1"]
+    assert not module.session_connected("tab-1")
+
+
+def test_session_connected_without_socket_server(monkeypatch):
+    module = importlib.import_module("sandro_uva_proyecto_final.sandro_uva_proyecto_final")
+    monkeypatch.setattr(module.app, "_event_namespace", None)
+
+    assert not module.session_connected("tab-1")
@@ -0,0 +1,163 @@
+"""
+Tests del simulador: paso físico puro, lógica automática y overrides manuales
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from simulation_api import data_generator as dg
+
+CONFIG_A = dg.TANK_CONFIGS["tank_a"]
+CONFIG_B = dg.TANK_CONFIGS["tank_b"]
+NOON = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def _step(level_a=120.0, level_b=200.0, chlorine=1.2, pump=False, chlorinator=False,
+          inflow=0.0, consumption=0.0):
+    return dg.simulate_step(
+        level_a, level_b, chlorine, pump, chlorinator, inflow, consumption,
+        CONFIG_A.min_height_cm, CONFIG_A.max_height_cm, CONFIG_A.cm_per_m3,
+        CONFIG_B.min_height_cm, CONFIG_B.max_height_cm, CONFIG_B.cm_per_m3,
+    )
+
+
+@pytest.fixture
+def generator():
+    return dg.SensorDataGenerator()
+
+
+# =================== PASO FÍSICO ===================
+
+def test_step_without_flows_only_degrades_chlorine():
+    level_a, level_b, chlorine, outflow = _step()
+
+    assert (level_a, level_b, outflow) == (120.0, 200.0, 0.0)
+    assert chlorine == pytest.approx(1.2 - 0.05 / 60)
+
+
+def test_step_pump_moves_water_from_a_to_b():
+    level_a, level_b, _, outflow = _step(pump=True)
+
+    assert outflow == 12.0
+    assert level_a == pytest.approx(120.0 - 12.0 / 60 * CONFIG_A.cm_per_m3)
+    assert level_b == pytest.approx(200.0 + 12.0 / 60 * CONFIG_B.cm_per_m3)
+
+
+def test_step_inflow_and_consumption():
+    level_a, level_b, _, _ = _step(inflow=6.0, consumption=3.0)
+
+    assert level_a == pytest.approx(120.0 + 6.0 / 60 * CONFIG_A.cm_per_m3)
+    assert level_b == pytest.approx(200.0 - 3.0 / 60 * CONFIG_B.cm_per_m3)
+
+
+def test_step_clamps_levels_and_chlorine():
+    level_a, level_b, chlorine, _ = _step(
+        level_a=CONFIG_A.max_height_cm, level_b=CONFIG_B.min_height_cm, chlorine=0.0,
+        inflow=1000.0, consumption=1000.0,
+    )
+    assert level_a == CONFIG_A.max_height_cm
+    assert level_b == CONFIG_B.min_height_cm
+    assert chlorine == 0.0
+
+    _, _, chlorine, _ = _step(chlorine=3.0, chlorinator=True)
+    assert chlorine == 3.0
+
+
+def test_step_chlorinator_adds_chlorine():
+    _, _, chlorine, _ = _step(chlorinator=True)
+
+    assert chlorine == pytest.approx(1.2 + (0.15 - 0.05) / 60)
+
+
+# =================== LÓGICA AUTOMÁTICA Y OVERRIDES ===================
+
+def test_auto_pump_turns_on_when_cistern_full(generator):
+    generator.tank_states["tank_a"]["water_level_cm"] = CONFIG_A.pump_on_cm
+
+    generator.update_tank_levels(NOON)
+
+    assert generator.tank_states["tank_a"]["pump_running"] is True
+    assert generator.tank_states["tank_a"]["last_pump_change"] == NOON
+    assert generator.tank_states["tank_a"]["flow_rate"] == 12.0
+
+
+def test_auto_pump_turns_off_when_cistern_low(generator):
+    generator.tank_states["tank_a"].update(water_level_cm=CONFIG_A.pump_off_cm, pump_running=True)
+
+    generator.update_tank_levels(NOON)
+
+    assert generator.tank_states["tank_a"]["pump_running"] is False
+
+
+def test_pump_override_keeps_manual_state(generator):
+    generator.pump_manual_override = True
+    generator.tank_states["tank_a"]["water_level_cm"] = CONFIG_A.max_height_cm
+
+    generator.update_tank_levels(NOON)
+
+    assert generator.tank_states["tank_a"]["pump_running"] is False
+    assert generator.tank_states["tank_a"]["flow_rate"] == 0.0
+
+
+def test_auto_chlorinator_follows_optimal_range(generator):
+    generator.tank_states["tank_b"]["chlorine_ppm"] = dg.CHLORINE_OPTIMAL_LOW_PPM - 0.1
+    generator.update_tank_levels(NOON)
+    assert generator.tank_states["tank_b"]["chlorinator_running"] is True
+
+    generator.tank_states["tank_b"]["chlorine_ppm"] = dg.CHLORINE_OPTIMAL_HIGH_PPM + 0.1
+    generator.update_tank_levels(NOON)
+    assert generator.tank_states["tank_b"]["chlorinator_running"] is False
+
+
+def test_chlorinator_override_keeps_manual_state(generator):
+    generator.chlorinator_manual_override = True
+    generator.tank_states["tank_b"].update(chlorine_ppm=0.1, chlorinator_running=False)
+
+    generator.update_tank_levels(NOON)
+
+    assert generator.tank_states["tank_b"]["chlorinator_running"] is False
+
+
+# =================== RUIDO ===================
+
+def test_noise_block_refills_within_bounds():
+    low, high = np.array([0.0, -1.0]), np.array([1.0, 0.0])
+    block = dg.NoiseBlock(np.random.default_rng(7), low, high)
+
+    rows = [block.next() for _ in range(dg.NOISE_BLOCK_SIZE + 10)]
+
+    assert all(0.0 <= a < 1.0 and -1.0 <= b < 0.0 for a, b in rows)
+    # El bloque nuevo no repite el anterior
+    assert rows[dg.NOISE_BLOCK_SIZE] != rows[0]
+
+
+# =================== LECTURAS ===================
+
+def test_build_readings_share_timestamp(generator):
+    readings = generator.build_readings(NOON)
+
+    assert [r["tank_id"] for r in readings] == list(dg.TANK_CONFIGS)
+    assert all(r["timestamp"] == NOON for r in readings)
+    assert "pump_status" in readings[0] and "chlorine_ppm" in readings[1]
+
+
+@pytest.mark.parametrize("ppm, chlorine_status, status", [
+    (0.3, "low", "low_chlorine"),
+    (0.6, "normal", "normal"),
+    (1.2, "optimal", "normal"),
+    (2.5, "high", "high_chlorine"),
+])
+def test_tank_b_chlorine_status(generator, ppm, chlorine_status, status):
+    generator.tank_states["tank_b"]["chlorine_ppm"] = ppm
+
+    reading = generator.build_reading("tank_b", NOON)
+
+    assert reading["chlorine_status"] == chlorine_status
+    assert reading["status"] == status
+
+
+@pytest.mark.parametrize("percent, status", [(10, "low_water"), (50, "normal"), (95, "high_water")])
+def test_level_status(percent, status):
+    assert dg.level_status(percent) == status
@@ -0,0 +1,166 @@
+"""
+Tests de utils.db sobre una base SQLite temporal (ver conftest.py)
+"""
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy.exc import IntegrityError  # noqa: E402
+
+from utils import db  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_database():
+    """Tablas recién creadas en cada test"""
+    db.Base.metadata.drop_all(bind=db.engine)
+    db.init_database()
+
+
+# =================== CONFIGURACIÓN ===================
+
+def test_default_config_is_loaded():
+    assert db.get_config_value("tank_a_min_level_cm") == db.DEFAULT_CONFIG["tank_a_min_level_cm"]
+    assert db.get_config_value("no_existe", "x") == "x"
+
+
+def test_config_reads_are_memoized_until_update():
+    db.get_config_value("tank_b_capacity_m3")
+    with db.engine.begin() as conn:
+        conn.execute(
+            db.SystemConfiguration.__table__.update()
+            .where(db.SystemConfiguration.config_key == "tank_b_capacity_m3")
+            .values(config_value="999")
+        )
+
+    # Escritura por fuera de update_config_value: el cache no se entera
+    assert db.get_config_value("tank_b_capacity_m3") == db.DEFAULT_CONFIG["tank_b_capacity_m3"]
+
+    db.update_config_value("tank_a_capacity_m3", "55")
+    assert db.get_config_value("tank_b_capacity_m3") == "999"
+
+
+def _config_rows(key):
+    with db.engine.connect() as conn:
+        return conn.execute(
+            db.select(db.SystemConfiguration.config_value).where(db.SystemConfiguration.config_key == key)
+        ).scalars().all()
+
+
+def test_update_existing_key_upserts_and_invalidates_cache():
+    assert db.get_config_value("chlorine_min_ppm") == "0.5"  # queda memoizado
+
+    assert db.update_config_value("chlorine_min_ppm", "0.6")
+
+    assert db.get_config_value("chlorine_min_ppm") == "0.6"
+    assert _config_rows("chlorine_min_ppm") == ["0.6"]
+
+
+def test_update_new_key_inserts_it():
+    assert db.get_config_value("nueva_clave") is None  # el None también queda memoizado
+
+    assert db.update_config_value("nueva_clave", "42", "Clave de prueba")
+
+    assert db.get_config_value("nueva_clave") == "42"
+    assert _config_rows("nueva_clave") == ["42"]
+
+
+# =================== ARRANQUE ===================
+
+def test_database_exists_uses_configured_sqlite_file():
+    assert db.engine.url.database.endswith("asadas_test.db")
+    assert db.database_exists()
+
+
+def test_startup_creates_missing_database_at_configured_path(tmp_path, monkeypatch):
+    db_file = tmp_path / "otra.db"
+    other_engine = db.create_engine(f"sqlite:///{db_file}")
+    monkeypatch.setattr(db, "engine", other_engine)
+
+    assert not db.database_exists()
+    db.startup_database()
+
+    assert db.database_exists()
+    assert db.inspect(other_engine).has_table("system_config")
+    other_engine.dispose()
+
+
+# Esquema de tank_readings/alerts antes de los índices compuestos, CHECK y server defaults
+BASELINE_SCHEMA = (
+    """CREATE TABLE tank_readings (
+        id INTEGER NOT NULL PRIMARY KEY, timestamp DATETIME, tank_id VARCHAR(10),
+        tank_name VARCHAR(50), water_level_cm FLOAT, water_level_percent FLOAT,
+        water_volume_m3 FLOAT, chlorine_ppm FLOAT, chlorine_status VARCHAR(20),
+        pump_status BOOLEAN, chlorinator_status BOOLEAN,
+        sensor_status VARCHAR(20), data_source VARCHAR(20))""",
+    "CREATE INDEX ix_tank_readings_id ON tank_readings (id)",
+    "CREATE INDEX ix_tank_readings_timestamp ON tank_readings (timestamp)",
+    "CREATE INDEX ix_tank_readings_tank_id ON tank_readings (tank_id)",
+    """CREATE TABLE alerts (
+        id INTEGER NOT NULL PRIMARY KEY, timestamp DATETIME, alert_type VARCHAR(30),
+        severity VARCHAR(10), tank_id VARCHAR(10), title VARCHAR(100), message TEXT,
+        status VARCHAR(20), resolved_at DATETIME, trigger_value FLOAT,
+        threshold_value FLOAT, email_sent BOOLEAN, email_sent_at DATETIME)""",
+    "CREATE INDEX ix_alerts_id ON alerts (id)",
+    "CREATE INDEX ix_alerts_timestamp ON alerts (timestamp)",
+    "INSERT INTO tank_readings (tank_id, water_level_cm) VALUES ('tank_a', 120.0)",
+)
+
+
+def test_startup_migrates_existing_database(tmp_path, monkeypatch):
+    other_engine = db.create_engine(f"sqlite:///{tmp_path / 'vieja.db'}")
+    monkeypatch.setattr(db, "engine", other_engine)
+    with other_engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(db.text(statement))
+
+    assert db.database_exists()
+    db.startup_database()
+
+    inspector = db.inspect(other_engine)
+    # create_all() agrega las tablas que faltaban
+    assert inspector.has_table("system_config")
+    assert inspector.has_table("alembic_version")
+
+    indexes = {ix["name"] for ix in inspector.get_indexes("tank_readings")}
+    assert "ix_tank_readings_tank_time" in indexes
+    assert not indexes & {"ix_tank_readings_timestamp", "ix_tank_readings_tank_id"}
+    assert {"ix_alerts_tank_status_time", "ix_alerts_active"} <= {
+        ix["name"] for ix in inspector.get_indexes("alerts")
+    }
+    assert {"ck_tank_readings_tank_id", "ck_tank_readings_data_source"} <= {
+        ck["name"] for ck in inspector.get_check_constraints("tank_readings")
+    }
+    assert "ck_alerts_severity" in {ck["name"] for ck in inspector.get_check_constraints("alerts")}
+
+    with other_engine.begin() as conn:
+        # Los datos sobreviven a la recreación de la tabla y los defaults ya son del servidor
+        row = conn.execute(db.text(
+            "SELECT tank_id, water_level_cm FROM tank_readings"
+        )).one()
+        assert tuple(row) == ("tank_a", 120.0)
+        conn.execute(db.text("INSERT INTO tank_readings (tank_id) VALUES ('tank_b')"))
+        new_row = conn.execute(db.text(
+            "SELECT sensor_status, data_source, timestamp FROM tank_readings WHERE tank_id = 'tank_b'"
+        )).one()
+        assert new_row[:2] == ("active", "sensor")
+        assert new_row[2] is not None
+        with pytest.raises(IntegrityError):
+            conn.execute(db.text("INSERT INTO tank_readings (tank_id) VALUES ('tank_z')"))
+
+    # Segundo arranque: ya en head, no cambia nada
+    db.startup_database()
+    other_engine.dispose()
+
+
+def test_new_database_is_stamped_at_head(tmp_path, monkeypatch):
+    other_engine = db.create_engine(f"sqlite:///{tmp_path / 'nueva.db'}")
+    monkeypatch.setattr(db, "engine", other_engine)
+
+    db.startup_database()
+
+    with other_engine.connect() as conn:
+        version = conn.execute(db.text("SELECT version_num FROM alembic_version")).scalar_one()
+    assert version == "0001"
+    other_engine.dispose()
@@ -3,11 +3,26 @@ Cliente API para conectar Reflex con FastAPI
 Maneja todas las comunicaciones con el servidor de sensores
 """
 
+import contextlib
+import socket
+import time
+import weakref
 import httpx
-import asyncio
+import orjson
 from typing import Dict, List, Any, Optional
 from datetime import datetime
-import json
+from urllib.parse import urlsplit
+
+
+# Ventana en la que se reutiliza la respuesta de /api/dashboard (segundos)
+DASHBOARD_TTL = 1.0
+
+# Sondeo de disponibilidad: timeout del connect TCP y cuánto se recuerda un resultado positivo
+PROBE_TIMEOUT = 0.2
+PROBE_OK_TTL = 5.0
+
+# Pool acotado: el dashboard hace pocas peticiones concurrentes contra un solo host
+CLIENT_LIMITS = httpx.Limits(max_keepalive_connections=4, max_connections=8)
 
 
 class SensorAPIClient:
@@ -15,57 +30,97 @@ class SensorAPIClient:
         self.base_url = base_url
         self.timeout = 10.0
 
-    async def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
-        """Realizar petición HTTP async con manejo de errores"""
-        url = f"{self.base_url}{endpoint}"
-
-        try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                if method.upper() == "GET":
-                    response = await client.get(url, **kwargs)
-                elif method.upper() == "POST":
-                    response = await client.post(url, **kwargs)
-                else:
-                    raise ValueError(f"Método HTTP no soportado: {method}")
-
-                response.raise_for_status()
-                return response.json()
-
-        except httpx.TimeoutException:
+        # Clientes persistentes: un pool de conexiones reutilizado entre llamadas
+        self._sync = httpx.Client(base_url=base_url, timeout=self.timeout, limits=CLIENT_LIMITS)
+        self._async: Optional[httpx.AsyncClient] = None
+        # Cierra el pool al recolectar el cliente o al salir del proceso (lo que ocurra primero)
+        self._finalizer = weakref.finalize(self, self._sync.close)
+
+        # Última respuesta de /api/dashboard y su instante (monotónico)
+        self._dashboard: Optional[Dict[str, Any]] = None
+        self._dashboard_ts = 0.0
+
+        # Host/puerto para el sondeo TCP de is_api_available()
+        parts = urlsplit(base_url)
+        self._host = parts.hostname or "localhost"
+        self._port = parts.port or (443 if parts.scheme == "https" else 80)
+        self._available_until = 0.0
+
+    def close(self) -> None:
+        """Cerrar el pool de conexiones sincrónico"""
+        self._finalizer()
+
+    async def aclose(self) -> None:
+        """
+        Cerrar ambos pools. El AsyncClient no se puede cerrar desde el finalizer
+        (hace falta el loop en el que se creó): llamar desde ese loop al apagar
+        """
+        if self._async is not None:
+            client, self._async = self._async, None
+            await client.aclose()
+        self.close()
+
+    @staticmethod
+    def _error_response(exc: Exception) -> Dict[str, Any]:
+        """Mapear excepciones de httpx a la respuesta de error de la API"""
+        if isinstance(exc, httpx.TimeoutException):
             return {
                 "success": False,
                 "error": "timeout",
                 "message": "Timeout conectando con API de sensores"
             }
-        except httpx.ConnectError:
+        if isinstance(exc, httpx.ConnectError):
             return {
                 "success": False,
                 "error": "connection_error",
                 "message": "No se puede conectar con API de sensores. ¿Está ejecutándose?"
             }
-        except httpx.HTTPStatusError as e:
+        if isinstance(exc, httpx.HTTPStatusError):
             return {
                 "success": False,
                 "error": "http_error",
-                "message": f"Error HTTP {e.response.status_code}: {e.response.text}"
+                "message": f"Error HTTP {exc.response.status_code}: {exc.response.text}"
             }
+        return {
+            "success": False,
+            "error": "unknown_error",
+            "message": f"Error inesperado: {str(exc)}"
+        }
+
+    @staticmethod
+    def _decode(response: httpx.Response) -> Dict[str, Any]:
+        """Decodificar JSON con orjson (la API responde con ORJSONResponse)"""
+        if response.headers.get("content-type", "").startswith("application/json"):
+            return orjson.loads(response.content)
+        return response.json()
+
+    async def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
+        """Realizar petición HTTP async con manejo de errores"""
+        # El AsyncClient queda ligado al loop en el que se crea: se crea al primer uso
+        if self._async is None:
+            self._async = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=CLIENT_LIMITS)
+
+        try:
+            if method.upper() not in ("GET", "POST"):
+                raise ValueError(f"Método HTTP no soportado: {method}")
+
+            response = await self._async.request(method.upper(), endpoint, **kwargs)
+            response.raise_for_status()
+            return self._decode(response)
         except Exception as e:
-            return {
-                "success": False,
-                "error": "unknown_error",
-                "message": f"Error inesperado: {str(e)}"
-            }
+            return self._error_response(e)
 
     def _make_sync_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
-        """Versión sincrónica para usar desde Reflex"""
+        """Versión sincrónica para usar desde Reflex (sin crear un event loop por llamada)"""
         try:
-            return asyncio.run(self._make_request(method, endpoint, **kwargs))
+            if method.upper() not in ("GET", "POST"):
+                raise ValueError(f"Método HTTP no soportado: {method}")
+
+            response = self._sync.request(method.upper(), endpoint, **kwargs)
+            response.raise_for_status()
+            return self._decode(response)
         except Exception as e:
-            return {
-                "success": False,
-                "error": "sync_error",
-                "message": f"Error en petición sincrónica: {str(e)}"
-            }
+            return self._error_response(e)
 
     # =================== ENDPOINTS DE MONITOREO ===================
 
@@ -73,6 +128,17 @@ class SensorAPIClient:
         """Obtener lecturas actuales de todos los sensores"""
         return self._make_sync_request("GET", "/api/readings")
 
+    def get_dashboard(self) -> Dict[str, Any]:
+        """Lecturas, estado y controles en una sola petición (reutilizada durante DASHBOARD_TTL)"""
+        now = time.monotonic()
+        if self._dashboard is not None and now - self._dashboard_ts < DASHBOARD_TTL:
+            return self._dashboard
+
+        result = self._make_sync_request("GET", "/api/dashboard")
+        if result.get("success", False):
+            self._dashboard, self._dashboard_ts = result, now
+        return result
+
     def get_tank_data(self, tank_id: str) -> Dict[str, Any]:
         """Obtener datos de un tanque específico"""
         return self._make_sync_request("GET", f"/api/tank/{tank_id}")
@@ -122,9 +188,15 @@ class SensorAPIClient:
         return self._make_sync_request("GET", "/health")
 
     def is_api_available(self) -> bool:
-        """Verificar rápidamente si la API está disponible"""
-        result = self.health_check()
-        return result.get("success", False) or "healthy" in str(result.get("status", ""))
+        """Verificar rápidamente si la API está disponible (connect TCP, sin petición HTTP)"""
+        if time.monotonic() < self._available_until:
+            return True
+        try:
+            socket.create_connection((self._host, self._port), timeout=PROBE_TIMEOUT).close()
+        except OSError:
+            return False
+        self._available_until = time.monotonic() + PROBE_OK_TTL
+        return True
 
     def get_api_info(self) -> Dict[str, Any]:
         """Obtener información general de la API"""
@@ -135,16 +207,42 @@ class SensorAPIClient:
 api_client = SensorAPIClient()
 
 
+@contextlib.asynccontextmanager
+async def api_client_lifespan():
+    """Lifespan para la app que use api_client (p.ej. app.register_lifespan_task): cerrarlo al salir"""
+    try:
+        yield
+    finally:
+        await api_client.aclose()
+
+
 # =================== FUNCIONES DE CONVENIENCIA ===================
 
 def cargar_datos_sensores() -> Dict[str, Any]:
     """Función principal para cargar datos desde Reflex"""
-    return api_client.get_current_readings()
+    dashboard = api_client.get_dashboard()
+    if not dashboard.get("success", False):
+        return dashboard
+    readings = dashboard["readings"]
+    manual = dashboard["control"]["manual_controls"]
+    return {
+        "success": True,
+        "timestamp": dashboard["last_update"],
+        "readings": readings,
+        "tanks_count": len(readings),
+        "control_modes": {
+            "pump_mode": "manual" if manual["pump_manual_mode"] else "automatic",
+            "chlorinator_mode": "manual" if manual["chlorinator_manual_mode"] else "automatic",
+        },
+    }
 
 
 def obtener_estado_sistema() -> Dict[str, Any]:
     """Obtener estado completo del sistema"""
-    return api_client.get_system_status()
+    dashboard = api_client.get_dashboard()
+    if not dashboard.get("success", False):
+        return dashboard
+    return {**dashboard["status"], "timestamp": dashboard["timestamp"]}
 
 
 def obtener_datos_historicos(horas: int = 24) -> Dict[str, Any]:
@@ -3,43 +3,91 @@ Configuración de Base de Datos para Sistema ASADAS Tsa Diglo
 Conexión SQLite para desarrollo, fácil migración a PostgreSQL
 """
 
-from sqlalchemy import create_engine, event
+from sqlalchemy import bindparam, create_engine, event, func, inspect, select, text
+from sqlalchemy.engine import Connection
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import StaticPool
+import logging
 import os
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Generator
+from typing import Generator, Dict, List, Any, Optional
+from datetime import datetime
+
+# Importar modelos (paquete hermano: ejecutar desde la raíz, p.ej. `python -m utils.db`)
+from database.models import (
+    Base,
+    DEFAULT_CONFIG,
+    Alert,
+    ChlorineOperation,
+    PumpOperation,
+    SystemConfiguration,
+    TankReading,
+)
 
-# Importar modelos
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from database.models import Base, DEFAULT_CONFIG, SystemConfiguration
-
-# Configuración de base de datos
-DATABASE_URL = "sqlite:///./asadas_tsa_diglo.db"
-
-# Crear engine con configuración optimizada para SQLite
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={
-        "check_same_thread": False,  # Permite múltiples threads
-        "timeout": 20  # Timeout en segundos
-    },
-    poolclass=StaticPool,
-    echo=False  # Cambiar a True para debug SQL
+# Hijo del logger "asadas" de la API: usa su nivel (LOG_LEVEL) y su handler en segundo plano
+logger = logging.getLogger("asadas.db")
+
+# Configuración de base de datos (SQLite por defecto, PostgreSQL/TimescaleDB vía DATABASE_URL)
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./asadas_tsa_diglo.db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# INSERT con soporte de ON CONFLICT (upsert) según el motor
+upsert_insert = sqlite_insert if IS_SQLITE else postgresql_insert
+
+if IS_SQLITE:
+    # Crear engine con configuración optimizada para SQLite
+    # Pool de varias conexiones: con WAL los lectores no se bloquean entre sí ni con el escritor
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={
+            "check_same_thread": False,  # Permite múltiples threads
+            "timeout": 20  # Timeout en segundos
+        },
+        pool_size=10,
+        max_overflow=20,
+        pool_recycle=3600,
+        pool_pre_ping=True,
+        echo=False  # Cambiar a True para debug SQL
+    )
+else:
+    engine = create_engine(DATABASE_URL, pool_pre_ping=True, echo=False)
+
+
+# PRAGMAs por conexión de SQLite, enviados en un solo executescript
+SQLITE_PRAGMAS = (
+    "PRAGMA foreign_keys=ON;"
+    "PRAGMA journal_mode=WAL;"  # Mejor concurrencia
+    "PRAGMA synchronous=NORMAL;"  # Balance rendimiento/seguridad
+    "PRAGMA cache_size=-65536;"  # 64 MiB de page cache (negativo = KiB)
+    "PRAGMA mmap_size=536870912;"  # 512 MiB de I/O mapeado en memoria
+    "PRAGMA temp_store=MEMORY;"  # Tablas/índices temporales en RAM
+    "PRAGMA journal_size_limit=67108864;"  # Truncar el WAL a 64 MiB tras checkpoint
 )
 
 
-# Habilitar foreign keys en SQLite
+# Habilitar foreign keys y ajustar cache/memoria en SQLite (los PRAGMAs son por conexión)
 @event.listens_for(engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
-    cursor.execute("PRAGMA journal_mode=WAL")  # Mejor concurrencia
-    cursor.execute("PRAGMA synchronous=NORMAL")  # Balance rendimiento/seguridad
-    cursor.close()
+    if not IS_SQLITE:
+        return
+    dbapi_connection.executescript(SQLITE_PRAGMAS)
+
+
+# Al cerrar una conexión (reciclado o dispose del pool) SQLite actualiza las estadísticas
+# del planificador solo donde hace falta, sin un ANALYZE completo
+@event.listens_for(engine, "close")
+def optimize_sqlite_on_close(dbapi_connection, connection_record):
+    if not IS_SQLITE:
+        return
+    try:
+        dbapi_connection.execute("PRAGMA optimize")
+    except Exception:
+        # La conexión se está cerrando igual: las estadísticas pueden esperar a la próxima
+        pass
 
 
 # SessionLocal para crear sesiones de base de datos
@@ -69,97 +117,292 @@ def init_database():
     """
     Inicializar base de datos: crear tablas y configuración por defecto
     """
-    print("🗄️ Inicializando base de datos...")
+    logger.info("🗄️ Inicializando base de datos...")
 
     # Crear todas las tablas
     Base.metadata.create_all(bind=engine)
-    print("✅ Tablas creadas exitosamente")
+    logger.info("✅ Tablas creadas exitosamente")
+
+    # Series temporales como hypertables (solo PostgreSQL + TimescaleDB)
+    setup_timescaledb()
 
     # Insertar configuración por defecto
     setup_default_config()
-    print("✅ Configuración por defecto cargada")
+    logger.info("✅ Configuración por defecto cargada")
+
+    logger.info("🎉 Base de datos inicializada correctamente")
+
+
+# Tablas de series temporales: (tabla, intervalo de chunk)
+TIMESCALE_HYPERTABLES = (
+    ("tank_readings", "7 days"),
+    ("alerts", "30 days"),
+)
+
 
-    print("🎉 Base de datos inicializada correctamente")
+# Rollup continuo de lecturas para /api/history
+HISTORY_ROLLUP_VIEW = "tank_readings_5m"
+
+# True cuando setup_timescaledb() dejó configuradas las hypertables y el rollup
+TIMESCALE_ENABLED = False
+
+
+def setup_timescaledb() -> bool:
+    """
+    Convertir tank_readings y alerts en hypertables de TimescaleDB
+    particionadas por timestamp, con compresión segmentada por tank_id
+    y retención según data_retention_days. Además crea el agregado
+    continuo de 5 minutos que respalda /api/history. No hace nada en SQLite.
+    """
+    global TIMESCALE_ENABLED
+
+    if engine.dialect.name != "postgresql":
+        return False
+
+    retention_days = int(DEFAULT_CONFIG["data_retention_days"])
+
+    try:
+        with engine.begin() as conn:
+            has_timescale = conn.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'")
+            ).first()
+            if not has_timescale:
+                logger.info("ℹ️ Extensión TimescaleDB no instalada, omitiendo hypertables...")
+                return False
+
+            for table, chunk_interval in TIMESCALE_HYPERTABLES:
+                is_hypertable = conn.execute(
+                    text(
+                        "SELECT 1 FROM timescaledb_information.hypertables "
+                        "WHERE hypertable_name = :table"
+                    ),
+                    {"table": table},
+                ).first()
+                if is_hypertable:
+                    continue
+
+                # La clave primaria debe incluir la columna de partición
+                conn.execute(text(
+                    f"ALTER TABLE {table} DROP CONSTRAINT {table}_pkey, "
+                    f"ADD PRIMARY KEY (id, timestamp)"
+                ))
+                conn.execute(text(
+                    f"SELECT create_hypertable('{table}', 'timestamp', "
+                    f"chunk_time_interval => INTERVAL '{chunk_interval}', migrate_data => true)"
+                ))
+                conn.execute(text(
+                    f"ALTER TABLE {table} SET (timescaledb.compress, "
+                    f"timescaledb.compress_segmentby = 'tank_id', "
+                    f"timescaledb.compress_orderby = 'timestamp DESC')"
+                ))
+                conn.execute(text(
+                    f"SELECT add_compression_policy('{table}', INTERVAL '{chunk_interval}', "
+                    f"if_not_exists => true)"
+                ))
+                conn.execute(text(
+                    f"SELECT add_retention_policy('{table}', INTERVAL '{retention_days} days', "
+                    f"if_not_exists => true)"
+                ))
+                logger.info("✅ Hypertable configurada: %s", table)
+
+            # WITH NO DATA: se puede crear dentro de la transacción; la política lo materializa
+            conn.execute(text(
+                f"CREATE MATERIALIZED VIEW IF NOT EXISTS {HISTORY_ROLLUP_VIEW} "
+                f"WITH (timescaledb.continuous) AS "
+                f"SELECT time_bucket('5 minutes', timestamp) AS bucket, tank_id, "
+                f"avg(water_level_cm) AS avg_level_cm, "
+                f"avg(water_level_percent) AS avg_level_pct, "
+                f"avg(chlorine_ppm) AS avg_chlorine "
+                f"FROM tank_readings GROUP BY bucket, tank_id "
+                f"WITH NO DATA"
+            ))
+            conn.execute(text(
+                f"SELECT add_continuous_aggregate_policy('{HISTORY_ROLLUP_VIEW}', "
+                f"start_offset => INTERVAL '1 day', end_offset => INTERVAL '5 minutes', "
+                f"schedule_interval => INTERVAL '5 minutes', if_not_exists => true)"
+            ))
+
+        TIMESCALE_ENABLED = True
+        return True
+    except Exception as e:
+        logger.error("❌ Error configurando TimescaleDB: %s", e)
+        return False
+
+
+@contextmanager
+def write_transaction() -> Generator[Connection, None, None]:
+    """
+    Transacción de escritura con commit/rollback automático.
+    En SQLite toma el lock de escritura al inicio (BEGIN IMMEDIATE) en lugar de
+    subir de lectura a escritura en el primer INSERT (y reintentar si está ocupado)
+    """
+    if not IS_SQLITE:
+        with engine.begin() as conn:
+            yield conn
+        return
+
+    with engine.connect() as conn:
+        # AUTOCOMMIT: el driver no abre su propio BEGIN y el transaccional es explícito
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
+        conn.exec_driver_sql("COMMIT")
 
 
 def setup_default_config():
     """
     Insertar configuración por defecto si no existe
     """
-    db = SessionLocal()
     try:
-        # Verificar si ya existe configuración
-        existing_config = db.query(SystemConfiguration).first()
-        if existing_config:
-            print("ℹ️ Configuración ya existe, omitiendo...")
-            return
-
-        # Insertar configuración por defecto
-        for key, value in DEFAULT_CONFIG.items():
-            config_item = SystemConfiguration(
-                config_key=key,
-                config_value=value,
-                description=f"Configuración por defecto para {key}"
-            )
-            db.add(config_item)
-
-        db.commit()
-        print(f"✅ {len(DEFAULT_CONFIG)} configuraciones agregadas")
+        with write_transaction() as conn:
+            # Verificar si ya existe configuración (dentro del lock: sin carrera con otro worker)
+            # Solo la PK de una fila: sondeo de existencia sin leer el resto de las columnas
+            has_config = conn.execute(select(SystemConfiguration.id).limit(1)).first() is not None
+            if has_config:
+                logger.info("ℹ️ Configuración ya existe, omitiendo...")
+                return
+
+            # Insertar configuración por defecto en un solo executemany (sin unit-of-work del ORM)
+            rows = [
+                {
+                    "config_key": key,
+                    "config_value": value,
+                    "description": f"Configuración por defecto para {key}",
+                }
+                for key, value in DEFAULT_CONFIG.items()
+            ]
+            conn.execute(SystemConfiguration.__table__.insert(), rows)
+
+        _load_config_value.cache_clear()
+        logger.info("✅ %s configuraciones agregadas", len(DEFAULT_CONFIG))
 
     except Exception as e:
-        print(f"❌ Error configurando base de datos: {e}")
-        db.rollback()
-    finally:
-        db.close()
+        logger.error("❌ Error configurando base de datos: %s", e)
 
 
 def get_config_value(key: str, default_value: str = None) -> str:
     """
     Obtener valor de configuración de la base de datos
     """
-    db = SessionLocal()
-    try:
-        config = db.query(SystemConfiguration).filter(
-            SystemConfiguration.config_key == key
-        ).first()
+    value = _load_config_value(key)
+    return default_value if value is None else value
+
+
+# SELECT de configuración armado una vez; en cada llamada solo cambia el valor de :key
+CONFIG_VALUE_BY_KEY = select(SystemConfiguration.config_value).where(
+    SystemConfiguration.config_key == bindparam("key")
+)
 
-        if config:
-            return config.config_value
-        return default_value
-    finally:
-        db.close()
+
+@lru_cache(maxsize=256)
+def _load_config_value(key: str) -> Optional[str]:
+    """
+    Leer un valor de configuración (memoizado; se invalida en cada escritura)
+    """
+    with engine.connect() as conn:
+        return conn.execute(CONFIG_VALUE_BY_KEY, {"key": key}).scalar_one_or_none()
 
 
 def update_config_value(key: str, value: str, description: str = None):
     """
-    Actualizar o crear valor de configuración
+    Actualizar o crear valor de configuración (un solo INSERT ... ON CONFLICT DO UPDATE)
     """
-    db = SessionLocal()
+    # ON CONFLICT no aplica onupdate: updated_at se fija explícitamente
+    changes = {"config_value": value, "updated_at": func.now()}
+    if description:
+        changes["description"] = description
+
+    stmt = upsert_insert(SystemConfiguration).values(
+        config_key=key,
+        config_value=value,
+        description=description or f"Configuración para {key}",
+    ).on_conflict_do_update(index_elements=["config_key"], set_=changes)
+
     try:
-        config = db.query(SystemConfiguration).filter(
-            SystemConfiguration.config_key == key
-        ).first()
-
-        if config:
-            config.config_value = value
-            if description:
-                config.description = description
-        else:
-            config = SystemConfiguration(
-                config_key=key,
-                config_value=value,
-                description=description or f"Configuración para {key}"
-            )
-            db.add(config)
-
-        db.commit()
+        with engine.begin() as conn:
+            conn.execute(stmt)
+        _load_config_value.cache_clear()
         return True
     except Exception as e:
-        print(f"❌ Error actualizando configuración {key}: {e}")
-        db.rollback()
+        logger.error("❌ Error actualizando configuración %s: %s", key, e)
         return False
-    finally:
-        db.close()
+
+
+# =================== ESCRITURA DE LECTURAS EN LOTE ===================
+
+def flush_readings(batch: List[Dict[str, Any]], data_source: str = "simulation") -> int:
+    """
+    Insertar un lote de lecturas en tank_readings con un solo executemany
+    (un round-trip y un commit por lote, sin pasar por el ORM)
+    Retorna la cantidad de filas insertadas
+    """
+    if not batch:
+        return 0
+
+    rows = [
+        {
+            "timestamp": r["timestamp"],
+            "tank_id": r["tank_id"],
+            "tank_name": r.get("tank_name"),
+            "water_level_cm": r.get("water_level_cm"),
+            "water_level_percent": r.get("water_level_percent"),
+            "water_volume_m3": r.get("water_volume_m3"),
+            "chlorine_ppm": r.get("chlorine_ppm"),
+            "chlorine_status": r.get("chlorine_status"),
+            "pump_status": bool(r.get("pump_status", False)),
+            "chlorinator_status": bool(r.get("chlorinator_status", False)),
+            "sensor_status": "active",
+            "data_source": data_source,
+        }
+        for r in batch
+    ]
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(TankReading.__table__.insert(), rows)
+        return len(rows)
+    except Exception as e:
+        logger.error("❌ Error insertando lote de lecturas: %s", e)
+        return 0
+
+
+def get_history_rollup(hours: int) -> Dict[str, List[Any]]:
+    """
+    Obtener el histórico de las últimas `hours` horas desde el rollup de
+    5 minutos, en columnas (más reciente primero). Vacío si no hay TimescaleDB.
+    """
+    if not TIMESCALE_ENABLED:
+        return {}
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                f"SELECT bucket, tank_id, avg_level_cm, avg_level_pct, avg_chlorine "
+                f"FROM {HISTORY_ROLLUP_VIEW} "
+                f"WHERE bucket > now() - make_interval(hours => :hours) "
+                f"ORDER BY bucket DESC"
+            ),
+            {"hours": hours},
+        ).all()
+
+    # Pivotear (bucket, tank_id) -> una fila por bucket con ambos tanques
+    by_bucket: Dict[datetime, Dict[str, Any]] = {}
+    for bucket, tank_id, level_cm, level_pct, chlorine in rows:
+        point = by_bucket.setdefault(bucket, {})
+        point[f"{tank_id}_level_cm"] = round(level_cm, 2) if level_cm is not None else None
+        point[f"{tank_id}_level_percent"] = round(level_pct, 1) if level_pct is not None else None
+        if tank_id == "tank_b":
+            point["chlorine_ppm"] = round(chlorine, 3) if chlorine is not None else None
+
+    fields = ("tank_a_level_cm", "tank_a_level_percent", "tank_b_level_cm", "tank_b_level_percent", "chlorine_ppm")
+    columns: Dict[str, List[Any]] = {"timestamp": list(by_bucket)}
+    for field in fields:
+        columns[field] = [point.get(field) for point in by_bucket.values()]
+    return columns
 
 
 def check_database_connection() -> bool:
@@ -167,39 +410,43 @@ def check_database_connection() -> bool:
     Verificar conexión a la base de datos
     """
     try:
-        db = SessionLocal()
-        # Intenta hacer una consulta simple
-        db.execute("SELECT 1")
-        db.close()
+        # Intenta hacer una consulta simple (conexión directa, sin sesión ORM)
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
         return True
     except Exception as e:
-        print(f"❌ Error de conexión a base de datos: {e}")
+        logger.error("❌ Error de conexión a base de datos: %s", e)
         return False
 
 
+# Tablas principales que reporta get_database_info(): (nombre en el reporte, modelo)
+DATABASE_INFO_TABLES = (
+    ("tank_readings", TankReading),
+    ("alerts", Alert),
+    ("pump_operations", PumpOperation),
+    ("chlorine_operations", ChlorineOperation),
+    ("system_config", SystemConfiguration),
+)
+
+# Un solo SELECT con un COUNT(*) escalar por tabla (un round-trip en lugar de cinco)
+DATABASE_INFO_COUNTS = select(*(
+    select(func.count()).select_from(model.__table__).scalar_subquery().label(name)
+    for name, model in DATABASE_INFO_TABLES
+))
+
+
 def get_database_info():
     """
     Obtener información sobre la base de datos
     """
     try:
-        db = SessionLocal()
-
-        # Obtener información de las tablas
-        tables_info = {}
-
-        # Contar registros en cada tabla principal
-        from database.models import TankReading, Alert, PumpOperation, ChlorineOperation
+        with engine.connect() as conn:
+            # Contar registros en cada tabla principal
+            counts = conn.execute(DATABASE_INFO_COUNTS).one()
 
-        tables_info['tank_readings'] = db.query(TankReading).count()
-        tables_info['alerts'] = db.query(Alert).count()
-        tables_info['pump_operations'] = db.query(PumpOperation).count()
-        tables_info['chlorine_operations'] = db.query(ChlorineOperation).count()
-        tables_info['system_config'] = db.query(SystemConfiguration).count()
-
-        db.close()
-        return tables_info
+        return dict(zip((name for name, _ in DATABASE_INFO_TABLES), counts))
     except Exception as e:
-        print(f"❌ Error obteniendo info de base de datos: {e}")
+        logger.error("❌ Error obteniendo info de base de datos: %s", e)
         return {}
 
 
@@ -208,15 +455,55 @@ def reset_database():
     CUIDADO: Elimina y recrea toda la base de datos
     Solo usar en desarrollo
     """
-    print("⚠️ ADVERTENCIA: Eliminando toda la base de datos...")
+    logger.warning("⚠️ ADVERTENCIA: Eliminando toda la base de datos...")
+
+    # Cerrar las conexiones del pool antes de eliminar las tablas
+    engine.dispose()
 
     # Eliminar todas las tablas
     Base.metadata.drop_all(bind=engine)
-    print("🗑️ Tablas eliminadas")
+    logger.info("🗑️ Tablas eliminadas")
 
     # Recrear base de datos
     init_database()
-    print("✅ Base de datos recreada")
+    logger.info("✅ Base de datos recreada")
+
+
+def database_exists() -> bool:
+    """
+    Ver si la base configurada en DATABASE_URL ya está creada.
+    SQLite: el archivo de engine.url (sin abrir conexión, que lo crearía vacío).
+    PostgreSQL: la tabla system_config, que init_database() crea y llena.
+    """
+    if IS_SQLITE:
+        db_file = engine.url.database
+        # Sin archivo (":memory:" o URL vacía) la base nace vacía en cada proceso
+        return bool(db_file) and db_file != ":memory:" and Path(db_file).is_file()
+    return inspect(engine).has_table(SystemConfiguration.__tablename__)
+
+
+# alembic.ini y alembic/ en la raíz del proyecto, sin depender del directorio actual
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+
+
+def run_migrations(stamp_only: bool = False):
+    """
+    Llevar el esquema a la última migración de alembic/versions (o solo marcarla
+    con stamp_only=True, para una base recién creada por create_all()).
+    """
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(str(ALEMBIC_INI))
+    # Sin fileConfig de alembic.ini: desactivaría los loggers "asadas" ya configurados
+    config.attributes["configure_logger"] = False
+
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        if stamp_only:
+            command.stamp(config, "head")
+        else:
+            command.upgrade(config, "head")
 
 
 # Función para ser llamada al iniciar la aplicación
@@ -224,25 +511,26 @@ def startup_database():
     """
     Función para ejecutar al iniciar la aplicación
     """
-    print("🚀 Iniciando configuración de base de datos...")
+    logger.info("🚀 Iniciando configuración de base de datos...")
 
-    # Verificar si el archivo de base de datos existe
-    db_file = "asadas_tsa_diglo.db"
-    if not os.path.exists(db_file):
-        print("📁 Base de datos no existe, creando...")
+    if not database_exists():
+        logger.info("📁 Base de datos no existe, creando...")
         init_database()
+        # El esquema ya sale completo del modelo: no hay nada que migrar
+        run_migrations(stamp_only=True)
     else:
-        print("📁 Base de datos encontrada")
-        # Verificar conexión
-        if check_database_connection():
-            print("✅ Conexión a base de datos exitosa")
-        else:
-            print("❌ Error de conexión, recreando base de datos...")
-            init_database()
-
+        logger.info("📁 Base de datos encontrada")
+        # create_all() revisa antes de crear: solo agrega las tablas que falten
+        Base.metadata.create_all(bind=engine)
+        # Índices, CHECK y defaults nuevos en tablas que ya existían
+        run_migrations()
+        logger.info("✅ Esquema actualizado")
+        # Idempotente: en TimescaleDB solo vuelve a activar el rollup de /api/history
+        setup_timescaledb()
 
 if __name__ == "__main__":
-    # Script para ejecutar directamente y configurar BD
+    # Script para configurar la BD: `python -m utils.db` desde la raíz del proyecto
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     print("🔧 Configurando base de datos directamente...")
     startup_database()
 